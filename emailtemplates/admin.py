@@ -10,6 +10,7 @@ from .models import (
     MassEmailMessage,
     MassEmailAttachment,
     EmailAttachment,
+    OutboxMessage,
 )
 
 
@@ -71,10 +72,35 @@ class MassEmailAttachmentInline(admin.TabularInline):
 
 
 class MassEmailMessageAdmin(admin.ModelAdmin):
-    list_display = ("subject", "date_sent")
-    readonly_fields = ["date_sent"]
+    list_display = (
+        "subject",
+        "date_sent",
+        "recipients_total",
+        "recipients_sent",
+        "recipients_failed",
+    )
+    readonly_fields = [
+        "date_sent",
+        "date_queued",
+        "date_started",
+        "date_finished",
+        "date_heartbeat",
+        "recipients_total",
+        "recipients_sent",
+        "recipients_failed",
+    ]
     form = MassEmailMessageForm
     inlines = [MassEmailAttachmentInline]
 
 
 admin.site.register(MassEmailMessage, MassEmailMessageAdmin)
+
+
+class OutboxMessageAdmin(admin.ModelAdmin):
+    list_display = ("subject", "to", "template_name", "status", "attempts", "created")
+    list_filter = ("status", "template_name")
+    search_fields = ("subject", "to")
+    readonly_fields = ["claimed", "date_sent", "attempts", "last_error"]
+
+
+admin.site.register(OutboxMessage, OutboxMessageAdmin)
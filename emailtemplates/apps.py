@@ -1,5 +1,7 @@
 # -*- coding: utf-8 -*-
 from django.apps import AppConfig
+from django.conf import settings
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.utils.translation import gettext_lazy as _
 
 
@@ -7,3 +9,35 @@ class EmailtempatesConfig(AppConfig):
     name = "emailtemplates"
     verbose_name = _("E-MAIL TEMPLATES")
     default_auto_field = "django.db.models.BigAutoField"
+
+    def ready(self):
+        from .cache import (
+            invalidate_email_template,
+            invalidate_email_template_attachments,
+            invalidate_email_template_attachments_m2m,
+        )
+        from .models import EmailAttachment, EmailTemplate
+
+        for signal in (post_save, post_delete):
+            signal.connect(
+                invalidate_email_template,
+                sender=EmailTemplate,
+                dispatch_uid="emailtemplates_invalidate_template",
+            )
+            for sender in (EmailAttachment, EmailTemplate.attachments.through):
+                signal.connect(
+                    invalidate_email_template_attachments,
+                    sender=sender,
+                    dispatch_uid="emailtemplates_invalidate_attachments",
+                )
+        m2m_changed.connect(
+            invalidate_email_template_attachments_m2m,
+            sender=EmailTemplate.attachments.through,
+            dispatch_uid="emailtemplates_invalidate_attachments_m2m",
+        )
+
+        if getattr(settings, "EMAILTEMPLATES_TIMINGS", False):
+            from .signals import stage_timed
+            from .timing import timings
+
+            stage_timed.connect(timings, dispatch_uid="emailtemplates_timings")
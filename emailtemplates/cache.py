@@ -0,0 +1,438 @@
+# coding=utf-8
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import transaction
+from django.template import Template
+from django.template.base import BLOCK_TAG_START, COMMENT_TAG_START, VARIABLE_TAG_START
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache(object):
+    """
+    Thread-safe mapping with bounded size. When the cache is full, the least recently used item is evicted.
+    """
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                self._data.move_to_end(key)
+            except KeyError:
+                return default
+            return self._data[key]
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def discard(self, predicate):
+        """
+        Removes all items which keys match given predicate.
+        """
+        with self._lock:
+            for key in [key for key in self._data if predicate(key)]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class CompiledTemplateCache(object):
+    """
+    Process-local cache of compiled database templates.
+
+    Templates are stored under `(title, language, content hash)` key, so the same template content is parsed only once
+    per process and edited content (even if updated without saving the model) is always compiled again.
+    Entries are dropped when EmailTemplate object is saved or deleted.
+    """
+
+    def __init__(self, maxsize=128):
+        self._cache = LRUCache(maxsize)
+
+    def get_template(self, key, content):
+        template = self._cache.get(key)
+        if template is None:
+            template = Template(content)
+            self._cache.set(key, template)
+            logger.debug("Compiled template %s", key)
+        return template
+
+    def invalidate(self, title):
+        self._cache.discard(lambda key: key[0] == title)
+
+    def clear(self):
+        self._cache.clear()
+
+
+class SubjectTemplateCache(object):
+    """
+    Process-local cache of compiled subject templates keyed by subject string.
+    """
+
+    markers = (VARIABLE_TAG_START, BLOCK_TAG_START, COMMENT_TAG_START)
+
+    def __init__(self, maxsize=128):
+        self._cache = LRUCache(maxsize)
+
+    def is_static(self, subject):
+        return not any(marker in subject for marker in self.markers)
+
+    def get_template(self, subject):
+        """
+        Returns compiled subject template or None if subject doesn't contain any template markup.
+        """
+        if self.is_static(subject):
+            return None
+        template = self._cache.get(subject)
+        if template is None:
+            template = Template(subject)
+            self._cache.set(subject, template)
+        return template
+
+    def clear(self):
+        self._cache.clear()
+
+
+class TemplateGenerations(object):
+    """
+    Generation tokens of email templates stored in configured Django cache backend.
+
+    Every `(title, language)` pair has its own token shared by all processes using the same cache backend.
+    The token is replaced with a new, unique value whenever template is changed, so processes can tell
+    whether their local copy of the template is still valid with a single cache hit.
+    Disabled unless EMAILTEMPLATES_CACHE_ALIAS is set to a cache shared by all processes (e.g. Redis or Memcached);
+    process-local and dummy backends are ignored, because other processes would never see the changes.
+    """
+
+    key_prefix = "emailtemplates:generation"
+    local_backends = (LocMemCache, DummyCache)
+
+    @property
+    def alias(self):
+        return getattr(settings, "EMAILTEMPLATES_CACHE_ALIAS", None)
+
+    @property
+    def enabled(self):
+        return self.alias is not None and not isinstance(
+            self.cache, self.local_backends
+        )
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def make_key(self, title, language):
+        digest = hashlib.sha256(("%s:%s" % (title, language)).encode("utf-8"))
+        return "%s:%s" % (self.key_prefix, digest.hexdigest())
+
+    def get(self, title, languages):
+        """
+        Returns tuple of generation tokens of template in given languages, fetched with a single cache hit.
+        """
+        keys = [self.make_key(title, language) for language in languages]
+        generations = self.cache.get_many(keys)
+        for key in keys:
+            if generations.get(key) is None:
+                self.cache.add(key, uuid.uuid4().hex, timeout=None)
+                generations[key] = self.cache.get(key)
+        return tuple(generations[key] for key in keys)
+
+    def bump(self, title, languages):
+        self.cache.set_many(
+            {
+                self.make_key(title, language): uuid.uuid4().hex
+                for language in languages
+            },
+            timeout=None,
+        )
+
+
+class ResolvedTemplateCache(object):
+    """
+    Process-local cache of EmailTemplate objects, validated against shared generation tokens.
+
+    Cached object is returned as long as its generation token hasn't changed, so sending email from
+    the same template doesn't hit the database, while changes made in any process are noticed
+    by the others on the next lookup.
+
+    Objects are kept at most EMAILTEMPLATES_TEMPLATE_CACHE_MAX_AGE seconds, in case a change wasn't noticed.
+    Missing templates are cached as well, for EMAILTEMPLATES_MISSING_TEMPLATE_TTL seconds,
+    so templates which are not overridden in database fall back to the filesystem without any query.
+    Creating the template bumps its generation, which drops negative entry immediately.
+
+    Templates changed inside a transaction are not cached until it's committed, so rolled back changes are never
+    served from the cache. When the cache backend fails, templates are loaded from database without caching.
+    """
+
+    def __init__(self, maxsize=128):
+        self._cache = LRUCache(maxsize)
+        self._pending = LRUCache(maxsize)
+        self.generations = TemplateGenerations()
+
+    @property
+    def enabled(self):
+        return self.generations.enabled
+
+    @property
+    def max_age(self):
+        return getattr(settings, "EMAILTEMPLATES_TEMPLATE_CACHE_MAX_AGE", 60)
+
+    @property
+    def missing_ttl(self):
+        return getattr(settings, "EMAILTEMPLATES_MISSING_TEMPLATE_TTL", 300)
+
+    def is_pending(self, title):
+        expires = self._pending.get(title)
+        return expires is not None and expires > time.monotonic()
+
+    def mark_pending(self, title):
+        """
+        Marks template as changed in not yet committed transaction. Mark expires after max age, because
+        nothing tells when transaction is rolled back.
+        """
+        self._pending.set(title, time.monotonic() + self.max_age)
+
+    def get_object(self, title, languages, loader):
+        """
+        Returns cached template object or calls `loader` to fetch it from database.
+
+        `languages` is the language fallback chain, starting with requested language. Object is cached
+        per requested language and it's invalidated when template in any language of the chain changes.
+        If template doesn't exist, ObjectDoesNotExist raised by `loader` is re-raised.
+        """
+        key = (title, languages[0])
+        try:
+            generation = self.generations.get(title, languages)
+        except Exception:
+            # cache backend is down, sending mustn't depend on it
+            logger.warning(
+                "Can't get generation of %s template from cache", title, exc_info=True
+            )
+            return loader()
+        entry = self._cache.get(key)
+        if entry is not None and entry[0] == generation and entry[2] > time.monotonic():
+            template_object = entry[1]
+            if isinstance(template_object, ObjectDoesNotExist):
+                raise template_object.__class__(*template_object.args)
+            return template_object
+        if entry is not None:
+            compiled_templates.invalidate(title)
+        cacheable = not self.is_pending(title)
+        try:
+            template_object = loader()
+        except ObjectDoesNotExist as e:
+            if self.missing_ttl and cacheable:
+                expires = time.monotonic() + self.missing_ttl
+                self._cache.set(key, (generation, e, expires))
+            raise
+        if self.max_age and cacheable:
+            expires = time.monotonic() + self.max_age
+            self._cache.set(key, (generation, template_object, expires))
+        return template_object
+
+    def invalidate(self, title, languages):
+        self._cache.discard(lambda key: key[0] == title)
+        self._pending.discard(lambda key: key == title)
+        if self.enabled:
+            try:
+                self.generations.bump(title, languages)
+            except Exception:
+                logger.error(
+                    "Can't bump generation of %s template in cache",
+                    title,
+                    exc_info=True,
+                )
+
+    def clear(self):
+        self._cache.clear()
+        self._pending.clear()
+
+
+class AttachmentCache(object):
+    """
+    Process-local cache of attachment files content, bounded by total size in bytes.
+
+    Files are identified by their name, size and modification time, so changed files are read again.
+    Files larger than the cache itself, or stored in storages which can't tell size or modification time,
+    are always read directly.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def size(self):
+        return self._size
+
+    def get_storage_file(self, storage, name):
+        """
+        Returns content of the file saved in the storage.
+        """
+
+        def read():
+            with storage.open(name, "rb") as f:
+                return f.read()
+
+        try:
+            size = storage.size(name)
+            key = (
+                storage.__class__.__name__,
+                getattr(storage, "location", ""),
+                name,
+                size,
+                storage.get_modified_time(name),
+            )
+        except (NotImplementedError, OSError):
+            return read()
+        return self._get(key, size, read)
+
+    def get_path(self, path):
+        """
+        Returns content of the file from local filesystem.
+        """
+
+        def read():
+            with open(path, "rb") as f:
+                return f.read()
+
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return read()
+        key = ("path", os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        return self._get(key, stat.st_size, read)
+
+    def _get(self, key, size, read):
+        if size > self.max_bytes:
+            return read()
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                return self._data[key]
+        content = read()
+        with self._lock:
+            if key not in self._data:
+                self._data[key] = content
+                self._size += len(content)
+            while self._size > self.max_bytes:
+                evicted_key, evicted = self._data.popitem(last=False)
+                self._size -= len(evicted)
+        return content
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+
+compiled_templates = CompiledTemplateCache(
+    maxsize=getattr(settings, "EMAILTEMPLATES_TEMPLATE_CACHE_SIZE", 256)
+)
+resolved_templates = ResolvedTemplateCache(
+    maxsize=getattr(settings, "EMAILTEMPLATES_TEMPLATE_CACHE_SIZE", 256)
+)
+subject_templates = SubjectTemplateCache(
+    maxsize=getattr(settings, "EMAILTEMPLATES_SUBJECT_CACHE_SIZE", 1024)
+)
+attachment_payloads = AttachmentCache(
+    max_bytes=getattr(
+        settings, "EMAILTEMPLATES_ATTACHMENT_CACHE_SIZE", 32 * 1024 * 1024
+    )
+)
+
+
+def clear_caches():
+    """
+    Clears all process-local template caches.
+    """
+    compiled_templates.clear()
+    resolved_templates.clear()
+    subject_templates.clear()
+    attachment_payloads.clear()
+
+
+def invalidate_template(title, language=None):
+    """
+    Drops cached entries of given template in this process and bumps its generation for the others.
+    All configured languages are invalidated, because template language may have been changed.
+    """
+    languages = {code for code, name in settings.LANGUAGES}
+    if language:
+        languages.add(language)
+    compiled_templates.invalidate(title)
+    resolved_templates.invalidate(title, languages)
+
+
+def invalidate_email_template(sender, instance, using=None, **kwargs):
+    """
+    Signal receiver dropping cached entries of saved or deleted EmailTemplate.
+
+    Generation is bumped once again after transaction commit, so processes which read the old row
+    before commit don't keep it. Until then the template isn't cached in this process.
+    """
+    invalidate_template(instance.title, instance.language)
+    if transaction.get_connection(using).in_atomic_block:
+        resolved_templates.mark_pending(instance.title)
+    transaction.on_commit(
+        lambda: invalidate_template(instance.title, instance.language), using=using
+    )
+
+
+def invalidate_email_template_attachments(sender, instance, **kwargs):
+    """
+    Signal receiver dropping cached templates related to changed attachment.
+    Works both for EmailAttachment and EmailTemplate.attachments through model instances.
+    """
+    email_template = getattr(instance, "emailtemplate", None)
+    if email_template is not None:
+        email_templates = [email_template]
+    else:
+        email_templates = instance.emailtemplate_set.all()
+    for email_template in email_templates:
+        invalidate_email_template(sender, email_template, kwargs.get("using"))
+
+
+def invalidate_email_template_attachments_m2m(sender, instance, reverse, **kwargs):
+    """
+    Signal receiver dropping cached templates when EmailTemplate.attachments relation changes.
+    """
+    if reverse:
+        invalidate_email_template_attachments(sender, instance, **kwargs)
+    else:
+        invalidate_email_template(sender, instance, **kwargs)
@@ -0,0 +1,184 @@
+# coding=utf-8
+import logging
+import threading
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from smtplib import SMTPException, SMTPServerDisconnected
+
+from django.conf import settings
+from django.core.mail import get_connection
+
+from .timing import timed_stage
+
+logger = logging.getLogger(__name__)
+
+SendResult = namedtuple("SendResult", ["to", "sent", "error"])
+
+
+class DeliveryReport(object):
+    """
+    Aggregated results of sending many messages.
+    """
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    def __iter__(self):
+        return iter(self.results)
+
+    def __len__(self):
+        return len(self.results)
+
+    @property
+    def sent(self):
+        """
+        Number of recipients which received the message.
+        """
+        return sum(1 for result in self.results if result.sent)
+
+    @property
+    def failed(self):
+        """
+        Number of recipients which didn't receive the message.
+        """
+        return len(self.results) - self.sent
+
+    @property
+    def errors(self):
+        return [result for result in self.results if not result.sent]
+
+
+def get_delivery_workers(workers=None):
+    """
+    Returns number of delivery threads, by default EMAILTEMPLATES_DELIVERY_WORKERS setting (1).
+    """
+    if workers is None:
+        workers = getattr(settings, "EMAILTEMPLATES_DELIVERY_WORKERS", 1)
+    return max(int(workers), 1)
+
+
+def is_disconnected(error):
+    """
+    Tells whether SMTP server closed the connection, e.g. after a limit of messages per connection.
+    """
+    return (
+        isinstance(error, SMTPServerDisconnected)
+        or getattr(error, "smtp_code", None) == 421
+    )
+
+
+def send_message(connection, msg, fail_silently=True):
+    """
+    Sends single message over given connection.
+    When server closes the connection, it's opened again and sending is retried once.
+
+    @return: SendResult(to, sent, error)
+    """
+    to = msg.to
+    template_info = getattr(msg, "template_info", {})
+    try:
+        with timed_stage("send", recipients=len(msg.recipients()), **template_info):
+            try:
+                sent = connection.send_messages([msg]) or 0
+            except SMTPException as e:
+                if not is_disconnected(e):
+                    raise
+                logger.warning(
+                    "Email connection closed by server (%s), reconnecting", e
+                )
+                connection.close()
+                connection.open()
+                sent = connection.send_messages([msg]) or 0
+    except SMTPException as e:
+        if not fail_silently:
+            raise
+        logger.error("Problem sending email to %s: %s", to, e)
+        return SendResult(to, 0, e)
+    if sent:
+        logger.info("Mail has been sent to: %s ", to)
+    return SendResult(to, sent, None)
+
+
+class ConnectionPool(object):
+    """
+    Email backend connections, one per thread. Connections are opened on first use and kept open until `close()`.
+    """
+
+    def __init__(self):
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def get(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = get_connection()
+            connection.open()
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            try:
+                connection.close()
+            except Exception as e:
+                logger.warning("Problem closing email connection: %s", e)
+
+
+def deliver_messages(messages, connection=None, fail_silently=True, workers=None):
+    """
+    Sends messages one by one, reusing connections.
+
+    Messages are sent over a single connection, or by a pool of `workers` threads, each of them with
+    its own connection (default: EMAILTEMPLATES_DELIVERY_WORKERS setting). Messages are consumed lazily
+    and results are returned in the same order as messages.
+
+    @param messages: iterable of EmailMessage objects
+    @param connection: email backend connection used for all messages; it disables thread pool.
+        By default a new connection is opened and closed afterwards.
+    @param fail_silently: When it's False, SMTPException is raised on the first error
+    @param workers: number of delivery threads
+    @return: generator of SendResult(to, sent, error) tuples
+    """
+    workers = get_delivery_workers(workers)
+    if connection is not None or workers == 1:
+        return _deliver_sequentially(messages, connection, fail_silently)
+    return _deliver_concurrently(messages, workers, fail_silently)
+
+
+def _deliver_sequentially(messages, connection, fail_silently):
+    connection = connection or get_connection()
+    opened = connection.open()
+    try:
+        for msg in messages:
+            yield send_message(connection, msg, fail_silently)
+    finally:
+        if opened:
+            connection.close()
+
+
+def _deliver_concurrently(messages, workers, fail_silently):
+    pool = ConnectionPool()
+
+    def send(msg):
+        return send_message(pool.get(), msg, fail_silently)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    pending = deque()
+    try:
+        for msg in messages:
+            pending.append(executor.submit(send, msg))
+            # limit number of messages waiting in memory
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        pool.close()
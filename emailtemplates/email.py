@@ -1,21 +1,154 @@
 # coding=utf-8
 import logging
 import os
+import copy
+import hashlib
 import re
+from collections import namedtuple
 from smtplib import SMTPException
 from urllib.parse import urljoin
 
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.mail import EmailMessage
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models import prefetch_related_objects
 from django.template import Template, Context, TemplateDoesNotExist
 from django.template.loader import get_template
+from django.utils.functional import SimpleLazyObject
 
-from .models import now, EmailTemplate
+from .cache import (
+    attachment_payloads,
+    compiled_templates,
+    resolved_templates,
+    subject_templates,
+)
+from .delivery import SendResult, deliver_messages
+from .helpers import language_fallbacks
+from .models import now, EmailTemplate, OutboxMessage
+from .profiling import profiled
 from .registry import email_templates
+from .timing import timed_stage
 
 logger = logging.getLogger(__name__)
 
+RenderedEmail = namedtuple("RenderedEmail", ["subject", "message"])
+
+
+def render_template(compiled_template, context):
+    """
+    Renders template compiled from string (django.template.Template) or loaded by template backend.
+    """
+    if isinstance(compiled_template, Template):
+        return compiled_template.render(Context(context))
+    return compiled_template.render(context)
+
+
+class ResolvedTemplate(object):
+    """
+    Immutable result of template resolution: compiled body and subject, default attachments and sender.
+
+    It doesn't keep any per-send state, so a single instance may be shared between threads
+    and reused for any number of recipients. Every `render()` call returns a new RenderedEmail.
+    """
+
+    def __init__(
+        self,
+        name,
+        compiled_template,
+        subject,
+        from_email,
+        language=None,
+        template_source="default",
+        attachments=(),
+        link_attachments=(),
+        content_subtype="html",
+    ):
+        """
+        @param compiled_template: compiled body template
+        @param subject: subject string, compiled when it contains template markup and template comes from database
+        @param attachments: (filename, content) pairs attached to every message
+        @param link_attachments: (name, url) pairs available in context as `default_attachments`,
+            or a function returning them, called only when template uses the variable
+        """
+        self.name = name
+        self.compiled_template = compiled_template
+        self.subject = subject
+        self.compiled_subject = (
+            subject_templates.get_template(subject)
+            if template_source == "database"
+            else None
+        )
+        self.from_email = from_email
+        self.language = language
+        self.template_source = template_source
+        self.template_info = {
+            "template_name": name,
+            "language": language,
+            "template_source": template_source,
+        }
+        self.attachments = tuple(attachments)
+        if callable(link_attachments):
+            self.link_attachments = SimpleLazyObject(link_attachments)
+        else:
+            self.link_attachments = list(link_attachments)
+        self.content_subtype = content_subtype
+
+    def get_context(self, context):
+        return dict(context, default_attachments=self.link_attachments)
+
+    def render_subject(self, context):
+        if self.compiled_subject is None:
+            return self.subject
+        return self.compiled_subject.render(Context(self.get_context(context)))
+
+    def render(self, context):
+        """
+        Renders subject and message for given context.
+
+        @return: RenderedEmail(subject, message)
+        """
+        with timed_stage("render", **self.template_info) as timer:
+            context = self.get_context(context)
+            rendered = RenderedEmail(
+                self.render_subject(context),
+                render_template(self.compiled_template, context),
+            )
+            timer.size = len(rendered.message.encode("utf-8"))
+        return rendered
+
+    def get_message(self, send_to, context, attachment_paths=None, **kwargs):
+        """
+        Returns EmailMessage rendered for given context, with default attachments.
+
+        @param send_to: list of recipient emails
+        @param attachment_paths: paths to attachments as received by django EmailMessage.attach_file(path) method
+        @param kwargs: kwargs passed to EmailMessage
+        """
+        rendered = self.render(context)
+        return self.get_message_object(
+            send_to, rendered, attachment_paths=attachment_paths, **kwargs
+        )
+
+    def get_message_object(self, send_to, rendered, attachment_paths=None, **kwargs):
+        kwargs["attachments"] = list(self.attachments) + list(
+            kwargs.get("attachments") or []
+        )
+        if kwargs.get("reply_to") is None:
+            defaut_reply_to_email = getattr(settings, "DEFAULT_REPLY_TO_EMAIL", None)
+            if defaut_reply_to_email:
+                kwargs["reply_to"] = [defaut_reply_to_email]
+
+        msg = EmailMessage(
+            rendered.subject, rendered.message, self.from_email, send_to, **kwargs
+        )
+        if attachment_paths:
+            for path in attachment_paths:
+                msg.attach(os.path.basename(path), attachment_payloads.get_path(path))
+        msg.content_subtype = self.content_subtype
+        msg.template_info = self.template_info
+        return msg
+
 
 class EmailFromTemplate(object):
     """
@@ -62,12 +195,15 @@ class EmailFromTemplate(object):
         self.base_url = base_url or getattr(settings, "BASE_URL", "")
 
         self.template = None
+        self.resolved_template = None
         self.compiled_template = None  # for storing compiled template
         self.context = {"date": now()}  # default context
         self.sent = 0  # number of messages sent
         self.message = ""
         self.content_subtype = "html"
         self._template_source = "default"
+        self._resolved_template_object = None
+        self._default_attachments = None
 
     @property
     def template_source(self):
@@ -84,14 +220,13 @@ class EmailFromTemplate(object):
     def __get_template_from_file(self):
         path = self.__get_path()
         try:
-            self.compiled_template = get_template(path)
+            return get_template(path)
         except (TemplateDoesNotExist, IOError):
             logger.warning(
                 "Can't find %s template in the filesystem, will use very default one.",
                 path,
             )
-        else:
-            self._template_source = "filesystem"
+        return None
 
     def build_absolute_uri(self, url: str):
         """
@@ -103,56 +238,192 @@ class EmailFromTemplate(object):
         return urljoin(self.base_url, url)
 
     def get_template_object(self):
+        """
+        Returns template object with prefetched attachments.
+
+        Template object is resolved once and memoized until the next `get_object()` call,
+        so rendering and attachments don't query the database again.
+        """
+        if self._resolved_template_object is None:
+            try:
+                self._resolved_template_object = self.resolve_template_object()
+            except ObjectDoesNotExist as e:
+                self._resolved_template_object = e
+        if isinstance(self._resolved_template_object, ObjectDoesNotExist):
+            exc = self._resolved_template_object
+            raise exc.__class__(*exc.args)
+        return self._resolved_template_object
+
+    def resolve_template_object(self):
         if self.template_object:
+            prefetch_related_objects([self.template_object], "attachments")
             return self.template_object
-        return self.template_class.objects.get(title=self.name, language=self.language)
+        if self.template_class is EmailTemplate and resolved_templates.enabled:
+            return resolved_templates.get_object(
+                self.name, self.get_languages(), self.load_template_object
+            )
+        return self.load_template_object()
+
+    def get_languages(self):
+        """
+        Returns language fallback chain used to look for template object.
+        """
+        return language_fallbacks(self.language)
+
+    def load_template_object(self):
+        """
+        Fetches template object in the first available language of the fallback chain with a single query.
+        """
+        languages = self.get_languages()
+        queryset = self.template_class.objects.filter(
+            title=self.name, language__in=languages
+        )
+        if len(languages) > 1:
+            queryset = queryset.annotate(
+                language_priority=Case(
+                    *[
+                        When(language=language, then=Value(priority))
+                        for priority, language in enumerate(languages)
+                    ],
+                    output_field=IntegerField(),
+                )
+            ).order_by("language_priority")
+        template_object = queryset.prefetch_related("attachments").first()
+        if template_object is None:
+            raise self.template_class.DoesNotExist(
+                "%s matching query does not exist."
+                % self.template_class._meta.object_name
+            )
+        return template_object
+
+    def get_template_cache_key(self, template_object):
+        """
+        Returns key of compiled template cache or None if template object can't be cached.
+        Key contains hash of template content, so edited template is never served from cache.
+        """
+        if not isinstance(template_object, EmailTemplate):
+            return None
+        content_hash = hashlib.sha256(
+            str(template_object.content).encode("utf-8")
+        ).hexdigest()
+        return template_object.title, template_object.language, content_hash
 
     def get_subject(self, template):
         subject_template = str(template.subject) or self.subject
-        subject = Template(subject_template).render(Context(self.get_context()))
-        return subject
+        compiled_subject = subject_templates.get_template(subject_template)
+        if compiled_subject is None:
+            return subject_template
+        return compiled_subject.render(Context(self.get_context()))
 
     def get_object(self):
-        while True:
-            try:
-                tmp = self.get_template_object()
-            except ObjectDoesNotExist:
-                logger.warning(
-                    "Can't find EmailTemplate object in database, using default file template."
-                )
-                break
-            except UnicodeError:
-                logger.warning(
-                    "Can't convert to unicode EmailTemplate object from database, using default file template."
-                )
-                break
+        """
+        Resolves template and stores it in instance attributes (template, compiled_template, subject).
+
+        Subject is rendered with `get_subject()` and current context. Use `resolve()` to get template
+        which may be shared between threads and recipients.
+        """
+        self._resolved_template_object = None
+        self._default_attachments = None
+        self.resolved_template = self.resolve(self.get_template_object)
+        self._template_source = self.resolved_template.template_source
+        if self.template_source == "database":
+            self.template = str(self.get_template_object().content)
+            self.compiled_template = self.resolved_template.compiled_template
+            self.subject = self.get_subject(self.get_template_object())
+        elif self.template_source == "filesystem":
+            self.compiled_template = self.resolved_template.compiled_template
+
+    def resolve(self, template_object_getter=None):
+        """
+        Returns ResolvedTemplate with compiled body and subject and loaded default attachments.
+
+        It doesn't change the instance, so it's safe to call from many threads.
+        Database template is used if it exists, then file template, then `self.template` string.
+        """
+        with self.timed("resolve") as timer:
+            resolved_template = self._resolve(template_object_getter)
+            timer.template_source = resolved_template.template_source
+        return resolved_template
+
+    def timed(self, stage, **kwargs):
+        """
+        Returns context manager measuring given stage of sending email, see `timing.timed_stage`.
+        """
+        kwargs.setdefault("template_source", self.template_source)
+        return timed_stage(stage, self.name, self.language, **kwargs)
+
+    def _resolve(self, template_object_getter=None):
+        template_object_getter = template_object_getter or self.resolve_template_object
+        try:
+            template_object = template_object_getter()
+            content = str(template_object.content)
+        except ObjectDoesNotExist:
+            logger.warning(
+                "Can't find EmailTemplate object in database, using default file template."
+            )
+        except UnicodeError:
+            logger.warning(
+                "Can't convert to unicode EmailTemplate object from database, using default file template."
+            )
+        else:
+            cache_key = self.get_template_cache_key(template_object)
+            if cache_key is not None:
+                compiled_template = compiled_templates.get_template(cache_key, content)
             else:
-                self.template = str(tmp.content)
-                self.subject = self.get_subject(tmp)
-                self._template_source = "database"
-                logger.debug("Got template %s from database", self.name)
-                return
+                compiled_template = Template(content)
+            logger.debug("Got template %s from database", self.name)
+            return ResolvedTemplate(
+                self.name,
+                compiled_template,
+                str(template_object.subject) or self.subject,
+                self.from_email,
+                language=self.language,
+                template_source="database",
+                attachments=self.collect_attachments(template_object, as_links=False),
+                link_attachments=lambda: self.collect_attachments(
+                    template_object, as_links=True
+                ),
+                content_subtype=self.content_subtype,
+            )
         # fallback
-        self.__get_template_from_file()
+        compiled_template = self.__get_template_from_file()
+        template_source = "filesystem"
+        if compiled_template is None:
+            compiled_template = self.compiled_template or Template(str(self.template))
+            template_source = "default"
+        return ResolvedTemplate(
+            self.name,
+            compiled_template,
+            self.subject,
+            self.from_email,
+            language=self.language,
+            template_source=template_source,
+            content_subtype=self.content_subtype,
+        )
 
     def __compile_template(self):
         if not self.compiled_template:
             self.compiled_template = Template(self.template)
 
     def get_context(self):
-        self.context.update(
-            {"default_attachments": self.get_default_attachments(as_links=True)}
-        )
+        """
+        Returns context with `default_attachments` list, evaluated once and only when template uses it.
+        """
+        if self._default_attachments is None:
+            self._default_attachments = SimpleLazyObject(
+                lambda: self.get_default_attachments(as_links=True)
+            )
+        self.context.update({"default_attachments": self._default_attachments})
         return self.context
 
     def render_message(self):
-        self.__compile_template()
-        try:
-            message = self.compiled_template.render(self.get_context())  #
-        except AttributeError:
-            # NOTE: for template from string Context() is still required!
-            message = self.compiled_template.render(Context(self.get_context()))
-        self.message = message
+        with profiled("render", self.name, self.language):
+            with self.timed("render") as timer:
+                self.__compile_template()
+                self.message = render_template(
+                    self.compiled_template, self.get_context()
+                )
+                timer.size = len(self.message.encode("utf-8"))
 
     def get_message_object(self, send_to, attachment_paths, *args, **kwargs):
         if kwargs.get("reply_to") is None:
@@ -165,11 +436,17 @@ class EmailFromTemplate(object):
         )
         if attachment_paths:
             for path in attachment_paths:
-                msg.attach_file(path)
+                msg.attach(os.path.basename(path), attachment_payloads.get_path(path))
         return msg
 
     def send_email(
-        self, send_to, attachment_paths=None, fail_silently=True, *args, **kwargs
+        self,
+        send_to,
+        attachment_paths=None,
+        fail_silently=True,
+        *args,
+        queue=False,
+        **kwargs
     ):
         """
         Sends email to recipient based on self object parameters.
@@ -177,15 +454,24 @@ class EmailFromTemplate(object):
         @param fail_silently: When it’s False, msg.send() will raise an smtplib.SMTPException if an error occurs.
         @param send_to: recipient email
         @param args: additional args passed to EmailMessage
+        @param queue: When it's True, message is saved in OutboxMessage table and sent later
+            by `send_queued_emails` management command.
         @param kwargs: kwargs passed to EmailMessage
         @param attachment_paths: paths to attachments as received by django EmailMessage.attach_file(path) method
-        @return: number of sent messages
+        @return: number of sent (or queued) messages
         """
         msg = self.get_message_object(send_to, attachment_paths, *args, **kwargs)
         msg.content_subtype = self.content_subtype
 
+        if queue:
+            with self.timed("queue", recipients=len(msg.recipients())):
+                self.queue_message(msg)
+            self.sent = 1
+            return self.sent
+
         try:
-            self.sent = msg.send()
+            with self.timed("send", recipients=len(msg.recipients())):
+                self.sent = msg.send()
         except SMTPException as e:
             if not fail_silently:
                 raise
@@ -193,17 +479,47 @@ class EmailFromTemplate(object):
 
         return self.sent
 
+    def queue_message(self, msg):
+        """
+        Saves message in the outbox, it will be sent by `send_queued_emails` management command.
+        """
+        outbox_message = OutboxMessage.from_message(msg, template_name=self.name)
+        outbox_message.save()
+        logger.info("Mail to %s has been queued", msg.to)
+        return outbox_message
+
     def get_default_attachments(self, as_links=False):
         """
         Prepare default attachments data (files will be include into email as attachments)
+        Attachments already loaded by `get_object()` are reused.
         """
-        attachments = []
         try:
             tmp = self.get_template_object()
         except ObjectDoesNotExist:
-            return attachments
+            return []
+        resolved_template = self.resolved_template
+        if (
+            resolved_template is not None
+            and resolved_template.template_source == "database"
+        ):
+            if as_links:
+                return list(resolved_template.link_attachments)
+            return list(resolved_template.attachments)
+        return self.collect_attachments(tmp, as_links)
 
-        for attachment in tmp.attachments.filter(send_as_link=as_links):
+    def collect_attachments(self, template_object, as_links=False):
+        if as_links:
+            return self._collect_attachments(template_object, as_links)
+        with self.timed("attachments", template_source="database") as timer:
+            attachments = self._collect_attachments(template_object, as_links)
+            timer.size = sum(len(content) for name, content in attachments)
+        return attachments
+
+    def _collect_attachments(self, template_object, as_links):
+        attachments = []
+        for attachment in template_object.attachments.all():
+            if attachment.send_as_link != as_links:
+                continue
             if as_links:
                 attachments.append(
                     (
@@ -215,12 +531,22 @@ class EmailFromTemplate(object):
                 attachments.append(
                     (
                         os.path.basename(attachment.attachment_file.name),
-                        attachment.attachment_file.read(),
+                        self.read_attachment(attachment.attachment_file),
                     )
                 )
         return attachments
 
-    def send(self, to, attachment_paths=None, *args, **kwargs):
+    def read_attachment(self, attachment_file):
+        """
+        Returns content of attachment file.
+        File is read directly from the storage, because attachment objects may be shared between sends,
+        and its content is cached for subsequent sends.
+        """
+        return attachment_payloads.get_storage_file(
+            attachment_file.storage, attachment_file.name
+        )
+
+    def send(self, to, attachment_paths=None, *args, queue=False, **kwargs):
         """This function does all the operations on eft object, that are necessary to send email.
         Usually one would use eft object like this:
              eft = EmailFromTemplate(name='sth/sth.html')
@@ -228,13 +554,106 @@ class EmailFromTemplate(object):
              eft.render_message()
              eft.send_email(['email@example.com'])
              return eft.sent
+
+        With queue=True the rendered message is saved in the outbox instead of being sent immediately.
+        Slow sends may be profiled, see `profiling.profiled()`.
         """
-        attachments = self.get_default_attachments(as_links=False)
-        attachments.extend(kwargs.pop("attachments", []))
+        with profiled("send", self.name, self.language):
+            self.get_object()
+            attachments = self.get_default_attachments(as_links=False)
+            attachments.extend(kwargs.pop("attachments", []))
 
-        self.get_object()
-        self.render_message()
-        self.send_email(to, attachment_paths, attachments=attachments, *args, **kwargs)
-        if self.sent:
+            self.render_message()
+            self.send_email(
+                to,
+                attachment_paths,
+                attachments=attachments,
+                *args,
+                queue=queue,
+                **kwargs,
+            )
+        if self.sent and not queue:
             logger.info("Mail has been sent to: %s ", to)
         return self.sent
+
+    def send_batch(
+        self,
+        recipients_with_context,
+        connection=None,
+        attachment_paths=None,
+        fail_silently=True,
+        workers=None,
+        **kwargs
+    ):
+        """
+        Renders and sends email to many recipients, reusing connections.
+
+        Template is resolved once, then message and subject are rendered for each recipient
+        with instance context updated with recipient's context.
+
+        @param recipients_with_context: iterable of (to, context) pairs, `to` is an email or list of emails
+        @param connection: email backend connection, by default a new connection is opened and closed afterwards
+        @param attachment_paths: paths to attachments added to every message
+        @param fail_silently: When it's False, SMTPException is raised on the first error
+        @param workers: number of delivery threads, see `deliver_messages()`
+        @param kwargs: kwargs passed to EmailMessage
+        @return: list of SendResult(to, sent, error) tuples, in the same order as recipients
+        """
+        messages = self.iter_messages(
+            recipients_with_context, attachment_paths, **kwargs
+        )
+        results = list(
+            deliver_messages(messages, connection, fail_silently, workers=workers)
+        )
+        self.sent = sum(result.sent for result in results)
+        return results
+
+    def iter_messages(self, recipients_with_context, attachment_paths=None, **kwargs):
+        """
+        Renders messages for many recipients without sending them.
+
+        Template and default attachments are resolved once, when the first message is requested.
+        Messages are rendered lazily, one at a time, so they can be passed to any email backend
+        (e.g. `connection.send_messages()`) or delivery stage.
+
+        @param recipients_with_context: iterable of (to, context) pairs, `to` is an email or list of emails
+        @param attachment_paths: paths to attachments added to every message
+        @param kwargs: kwargs passed to EmailMessage
+        @return: generator of EmailMessage objects
+        """
+        resolved_template = self.resolve()
+        for to, context in recipients_with_context:
+            if isinstance(to, str):
+                to = [to]
+            yield resolved_template.get_message(
+                to, dict(self.context, **context), attachment_paths, **kwargs
+            )
+
+    def send_to_each(
+        self,
+        recipients,
+        attachment_paths=None,
+        connection=None,
+        fail_silently=True,
+        workers=None,
+        **kwargs
+    ):
+        """
+        Renders message once and sends it separately to every recipient, reusing connections.
+
+        Only `To` header is changed between recipients, so the context must not depend on the recipient.
+        Messages are sent lazily, while the returned generator is consumed.
+
+        @param recipients: iterable of emails
+        @param workers: number of delivery threads, see `deliver_messages()`
+        @return: generator of SendResult(to, sent, error) tuples
+        """
+        msg = self.resolve().get_message([], self.context, attachment_paths, **kwargs)
+
+        def messages():
+            for recipient in recipients:
+                recipient_msg = copy.copy(msg)
+                recipient_msg.to = [recipient]
+                yield recipient_msg
+
+        return deliver_messages(messages(), connection, fail_silently, workers=workers)
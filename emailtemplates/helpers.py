@@ -11,6 +11,7 @@ except ImportError:
 from django.template.loaders import app_directories
 from django.contrib.auth import get_user_model
 from django.conf import settings
+from django.db.models.query import FlatValuesListIterable
 
 
 class SubstringMatcher(object):
@@ -49,14 +50,85 @@ class TemplateSourceLoader:
         return get_template(template_name).template.source
 
 
+def language_fallbacks(language):
+    """
+    Returns list of languages used to look for email template in given language, starting with the language itself.
+
+    By default the chain is: language, its generic variant and settings.LANGUAGE_CODE, e.g. de-at -> de -> en-us.
+    Chains can be configured per language with EMAILTEMPLATES_LANGUAGE_FALLBACKS setting, e.g.
+    >>> EMAILTEMPLATES_LANGUAGE_FALLBACKS = {'de-at': ['de', 'en'], 'pl': []}
+    Without language (e.g. translations deactivated) only settings.LANGUAGE_CODE is used.
+
+    :rtype list
+    """
+    if not language:
+        return [settings.LANGUAGE_CODE]
+    fallbacks = getattr(settings, "EMAILTEMPLATES_LANGUAGE_FALLBACKS", {})
+    if language in fallbacks:
+        chain = [language] + list(fallbacks[language])
+    else:
+        chain = [language, language.split("-")[0], settings.LANGUAGE_CODE]
+    languages = []
+    for code in chain:
+        if code and code not in languages:
+            languages.append(code)
+    return languages
+
+
+class ChunkedValuesIterable(object):
+    """
+    Iterates over distinct values of queryset field in chunks, using keyset pagination
+    (`WHERE field > last_value ORDER BY field LIMIT chunk_size`), so memory usage doesn't depend
+    on the number of rows and no cursor is kept open between chunks.
+    """
+
+    def __init__(self, queryset, field, chunk_size=2000):
+        self.queryset = (
+            queryset.order_by(field).values_list(field, flat=True).distinct()
+        )
+        self.field = field
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        queryset = self.queryset
+        while True:
+            chunk = list(queryset[: self.chunk_size])
+            if not chunk:
+                return
+            for value in chunk:
+                yield value
+            if len(chunk) < self.chunk_size:
+                return
+            queryset = self.queryset.filter(**{"%s__gt" % self.field: chunk[-1]})
+
+    @classmethod
+    def from_queryset(cls, queryset, chunk_size=2000):
+        """
+        Returns ChunkedValuesIterable iterating over flat `values_list()` queryset of a single field,
+        or None if queryset can't be paginated this way (e.g. it returns model instances or it's sliced).
+        """
+        if (
+            queryset._iterable_class is not FlatValuesListIterable
+            or len(queryset._fields) != 1
+            or queryset.query.is_sliced
+        ):
+            return None
+        return cls(queryset, queryset._fields[0], chunk_size=chunk_size)
+
+    def count(self):
+        return self.queryset.count()
+
+
 def mass_mailing_recipients():
     """
     Returns iterable of all mass email recipients.
-    Default behavior will be to return list of all active users' emails.
+    Default behavior will be to return queryset of all active users' emails.
     This can be changed by providing callback in settings return some other list of users,
     when user emails are stored in many, non default models.
     To accomplish that add constant MASS_EMAIL_RECIPIENTS to settings. It should contain path to function, e.g.
     >>> MASS_EMAIL_RECIPIENTS = 'emailtemplates.helpers.mass_mailing_recipients'
+    Callback may return any iterable of emails: list, generator, queryset or ChunkedValuesIterable.
+    `MassEmailMessage.send()` fetches querysets from database in chunks.
 
     :rtype iterable
     """
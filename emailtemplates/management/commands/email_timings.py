@@ -0,0 +1,62 @@
+# coding=utf-8
+import json
+
+from django.core.management.base import BaseCommand
+
+from emailtemplates.timing import timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Shows timings of sending email stages collected by all processes "
+        "(requires EMAILTEMPLATES_TIMINGS setting and cache shared between processes)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--json", action="store_true", help="Print statistics as JSON."
+        )
+        parser.add_argument(
+            "--reset", action="store_true", help="Remove collected statistics."
+        )
+
+    def handle(self, *args, **options):
+        if options["reset"]:
+            timings.clear()
+            self.stdout.write("Timings removed.")
+            return
+        stats = sorted(timings.read(), key=lambda stats: -stats["total"])
+        if options["json"]:
+            self.stdout.write(json.dumps(stats, indent=2))
+            return
+        if not stats:
+            self.stdout.write("No timings collected.")
+            return
+        row = "%-12s %-40s %-8s %8s %10s %10s %12s %10s"
+        self.stdout.write(
+            row
+            % (
+                "stage",
+                "template",
+                "language",
+                "count",
+                "mean [ms]",
+                "max [ms]",
+                "bytes",
+                "recipients",
+            )
+        )
+        for stats in stats:
+            self.stdout.write(
+                row
+                % (
+                    stats["stage"],
+                    stats["template_name"] or "-",
+                    stats["language"] or "-",
+                    stats["count"],
+                    "%.2f" % (stats["total"] / stats["count"] * 1000),
+                    "%.2f" % (stats["max"] * 1000),
+                    stats["bytes"],
+                    stats["recipients"],
+                )
+            )
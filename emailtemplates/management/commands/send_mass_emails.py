@@ -0,0 +1,54 @@
+# coding=utf-8
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from emailtemplates.models import MassEmailMessage
+from emailtemplates.timing import timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends queued mass email messages, one at a time. "
+        "Run it separately from send_queued_emails, so long mailings don't delay outbox messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="Number of delivery threads (default: EMAILTEMPLATES_DELIVERY_WORKERS setting).",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep waiting for new messages instead of exiting when there are no queued messages.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking for queued messages again (with --loop).",
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            mass_email_message = MassEmailMessage.objects.claim()
+            if mass_email_message is not None:
+                mass_email_message.send(workers=options["workers"])
+                self.stdout.write(
+                    "Sent mass email message %s: %d sent, %d failed."
+                    % (
+                        mass_email_message.pk,
+                        mass_email_message.recipients_sent,
+                        mass_email_message.recipients_failed,
+                    )
+                )
+                if getattr(settings, "EMAILTEMPLATES_TIMINGS", False):
+                    timings.flush()
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
@@ -0,0 +1,58 @@
+# coding=utf-8
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from emailtemplates.models import OutboxMessage
+from emailtemplates.timing import timings
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends email messages queued in the outbox. "
+        "Mass email messages are sent by send_mass_emails command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of messages claimed at once.",
+        )
+        parser.add_argument(
+            "--max-attempts",
+            type=int,
+            default=3,
+            help="Number of attempts after which message is marked as failed.",
+        )
+        parser.add_argument(
+            "--loop",
+            action="store_true",
+            help="Keep waiting for new messages instead of exiting when the outbox is empty.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=5,
+            help="Seconds to wait before checking empty outbox again (with --loop).",
+        )
+
+    def handle(self, *args, **options):
+        total_sent = total_failed = 0
+        while True:
+            sent, failed = OutboxMessage.objects.send_queued(
+                batch_size=options["batch_size"],
+                max_attempts=options["max_attempts"],
+            )
+            total_sent += sent
+            total_failed += failed
+            if sent or failed:
+                continue
+            if not options["loop"]:
+                break
+            time.sleep(options["sleep"])
+        self.stdout.write("Sent %d messages, %d failed." % (total_sent, total_failed))
+        if getattr(settings, "EMAILTEMPLATES_TIMINGS", False):
+            timings.flush()
@@ -0,0 +1,102 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emailtemplates", "0012_auto_20221103_1506"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="OutboxMessage",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "template_name",
+                    models.CharField(
+                        blank=True, max_length=255, verbose_name="template"
+                    ),
+                ),
+                ("subject", models.TextField(blank=True, verbose_name="subject")),
+                ("body", models.TextField(blank=True, verbose_name="content")),
+                (
+                    "content_subtype",
+                    models.CharField(
+                        default="html", max_length=20, verbose_name="content subtype"
+                    ),
+                ),
+                (
+                    "from_email",
+                    models.CharField(max_length=255, verbose_name="from email"),
+                ),
+                ("to", models.JSONField(default=list, verbose_name="to")),
+                ("cc", models.JSONField(blank=True, default=list, verbose_name="cc")),
+                ("bcc", models.JSONField(blank=True, default=list, verbose_name="bcc")),
+                (
+                    "reply_to",
+                    models.JSONField(blank=True, default=list, verbose_name="reply to"),
+                ),
+                (
+                    "headers",
+                    models.JSONField(blank=True, default=dict, verbose_name="headers"),
+                ),
+                (
+                    "attachments",
+                    models.JSONField(
+                        blank=True, default=list, verbose_name="attachments"
+                    ),
+                ),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[
+                            ("queued", "queued"),
+                            ("sending", "sending"),
+                            ("sent", "sent"),
+                            ("failed", "failed"),
+                        ],
+                        db_index=True,
+                        default="queued",
+                        max_length=10,
+                        verbose_name="status",
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.PositiveIntegerField(default=0, verbose_name="attempts"),
+                ),
+                ("last_error", models.TextField(blank=True, verbose_name="last error")),
+                (
+                    "created",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="created"
+                    ),
+                ),
+                (
+                    "claimed",
+                    models.DateTimeField(blank=True, null=True, verbose_name="claimed"),
+                ),
+                (
+                    "date_sent",
+                    models.DateTimeField(blank=True, null=True, verbose_name="sent"),
+                ),
+            ],
+            options={
+                "verbose_name": "Outbox message",
+                "verbose_name_plural": "Outbox messages",
+                "ordering": ("-created",),
+            },
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emailtemplates", "0013_outboxmessage"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="date_finished",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="finished"),
+        ),
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="date_queued",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="queued"),
+        ),
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="date_started",
+            field=models.DateTimeField(blank=True, null=True, verbose_name="started"),
+        ),
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="recipients_failed",
+            field=models.PositiveIntegerField(
+                default=0, verbose_name="failed messages"
+            ),
+        ),
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="recipients_sent",
+            field=models.PositiveIntegerField(default=0, verbose_name="sent messages"),
+        ),
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="recipients_total",
+            field=models.PositiveIntegerField(
+                blank=True, null=True, verbose_name="recipients"
+            ),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:28
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emailtemplates", "0014_massemailmessage_progress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MassEmailDelivery",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("email", models.CharField(max_length=254, verbose_name="email")),
+                (
+                    "delivered",
+                    models.BooleanField(default=True, verbose_name="delivered"),
+                ),
+                ("error", models.TextField(blank=True, verbose_name="error")),
+                (
+                    "date_sent",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="sent"
+                    ),
+                ),
+                (
+                    "mass_email_message",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="deliveries",
+                        to="emailtemplates.massemailmessage",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Mass email delivery",
+                "verbose_name_plural": "Mass email deliveries",
+                "indexes": [
+                    models.Index(
+                        fields=["mass_email_message", "email"],
+                        name="emailtempla_mass_em_c67f43_idx",
+                    )
+                ],
+            },
+        ),
+    ]
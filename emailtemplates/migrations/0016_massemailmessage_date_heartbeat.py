@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 20:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("emailtemplates", "0015_massemaildelivery"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="massemailmessage",
+            name="date_heartbeat",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="last progress"
+            ),
+        ),
+    ]
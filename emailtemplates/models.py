@@ -1,13 +1,24 @@
 # coding=utf-8
+import base64
 import logging
 import os
+import time
+from datetime import timedelta
+from itertools import islice
+from email.mime.base import MIMEBase
 
 from django.conf import settings
-from django.db import models
+from django.core.mail import EmailMessage
+from django.db import connections, models, transaction
+from django.db.models import F, Q
 from django.utils import translation
 from django.utils.translation import gettext_lazy as _
 
-from emailtemplates.helpers import TemplateSourceLoader, mass_mailing_recipients
+from emailtemplates.helpers import (
+    ChunkedValuesIterable,
+    TemplateSourceLoader,
+    mass_mailing_recipients,
+)
 from emailtemplates.registry import email_templates, NotRegistered
 
 try:
@@ -114,6 +125,49 @@ class EmailAttachment(BaseEmailAttachment):
     # email_template = models.ForeignKey(EmailTemplate, verbose_name=_('email template'), on_delete=models.CASCADE)
 
 
+class MassEmailMessageQuerySet(models.QuerySet):
+    def queued(self):
+        return self.filter(
+            date_queued__isnull=False, date_started__isnull=True, date_sent__isnull=True
+        )
+
+    def stale(self, stale_after=None):
+        """
+        Returns messages which were started, but didn't report progress within `stale_after`
+        (by default `MassEmailMessage.stale_after`), e.g. because the worker sending them was killed.
+        """
+        deadline = now() - (stale_after or MassEmailMessage.stale_after)
+        return self.filter(
+            Q(date_heartbeat__lt=deadline)
+            | Q(date_heartbeat__isnull=True, date_started__lt=deadline),
+            date_queued__isnull=False,
+            date_started__isnull=False,
+            date_finished__isnull=True,
+            date_sent__isnull=True,
+        )
+
+    def claim(self, stale_after=None):
+        """
+        Claims the oldest queued mass email message and marks it as started.
+
+        Rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED` where supported, so many workers
+        never send the same message. Messages abandoned by their worker (see `stale()`) are claimed again,
+        sending is resumed from the first recipient who didn't receive the message.
+        """
+        with transaction.atomic():
+            queryset = (self.queued() | self.stale(stale_after)).order_by(
+                "date_queued", "pk"
+            )
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            mass_email_message = queryset.first()
+            if mass_email_message is None:
+                return None
+            mass_email_message.date_started = mass_email_message.date_heartbeat = now()
+            mass_email_message.save(update_fields=["date_started", "date_heartbeat"])
+        return mass_email_message
+
+
 class MassEmailMessage(models.Model):
     id = models.BigAutoField(
         auto_created=True, primary_key=True, serialize=False, verbose_name=_("ID")
@@ -121,6 +175,27 @@ class MassEmailMessage(models.Model):
     subject = models.CharField(_("subject"), max_length=255)
     content = models.TextField(_("content"))
     date_sent = models.DateTimeField(_("sent"), null=True, blank=True)
+    date_queued = models.DateTimeField(_("queued"), null=True, blank=True)
+    date_started = models.DateTimeField(_("started"), null=True, blank=True)
+    date_finished = models.DateTimeField(_("finished"), null=True, blank=True)
+    date_heartbeat = models.DateTimeField(_("last progress"), null=True, blank=True)
+    recipients_total = models.PositiveIntegerField(
+        _("recipients"), null=True, blank=True
+    )
+    recipients_sent = models.PositiveIntegerField(_("sent messages"), default=0)
+    recipients_failed = models.PositiveIntegerField(_("failed messages"), default=0)
+
+    objects = MassEmailMessageQuerySet.as_manager()
+
+    # number of recipients after which progress is saved in database
+    progress_batch_size = 100
+    # number of recipients fetched at once from flat values_list() querysets
+    recipients_chunk_size = 2000
+    # seconds after which progress is saved even if batch isn't complete yet
+    heartbeat_interval = 60
+    # time without saved progress after which sending is considered interrupted;
+    # set EMAIL_TIMEOUT, so a hanging SMTP connection can't block the worker for longer
+    stale_after = timedelta(minutes=15)
 
     class Meta:
         verbose_name = _("Mass email message")
@@ -133,12 +208,113 @@ class MassEmailMessage(models.Model):
     def sent(self):
         return bool(self.date_sent)
 
-    def send(self, recipients=None, force=False):
+    @property
+    def queued(self):
+        return bool(self.date_queued) and not self.sent and not self.date_finished
+
+    @property
+    def stale(self):
+        """
+        Tells whether sending was started, but progress wasn't saved within `stale_after`.
+        """
+        if not self.date_started or self.date_finished or self.sent:
+            return False
+        heartbeat = self.date_heartbeat or self.date_started
+        return heartbeat < now() - self.stale_after
+
+    def queue(self):
+        """
+        Queues message to be sent by `send_mass_emails` management command.
+        """
+        self.date_queued = now()
+        self.date_started = None
+        self.save(update_fields=["date_queued", "date_started"])
+
+    def progress(self):
+        """
+        Returns dict describing sending progress.
+        """
+        return {
+            "id": self.pk,
+            "queued": self.date_queued,
+            "started": self.date_started,
+            "finished": self.date_finished,
+            "total": self.recipients_total,
+            "sent": self.recipients_sent,
+            "failed": self.recipients_failed,
+            "done": self.date_finished is not None,
+            "stale": self.stale,
+        }
+
+    def save_progress(self, *fields, check_claim=True):
+        """
+        Saves sending progress, which also serves as a heartbeat of the worker.
+
+        With `check_claim` progress is saved only if the message wasn't claimed by another worker
+        in the meantime, i.e. its `date_started` in database is still the same as in this instance.
+
+        @return: False if the message was claimed by another worker
+        """
+        self.date_heartbeat = now()
+        fields = ("recipients_sent", "recipients_failed", "date_heartbeat") + fields
+        queryset = MassEmailMessage.objects.filter(pk=self.pk)
+        if check_claim:
+            queryset = queryset.filter(date_started=self.date_started)
+        return bool(
+            queryset.update(**{field: getattr(self, field) for field in fields})
+        )
+
+    def count_recipients(self, recipients):
+        """
+        Returns number of recipients or None if it's unknown (e.g. for generators).
+        """
+        if isinstance(recipients, (models.QuerySet, ChunkedValuesIterable)):
+            return recipients.count()
+        if hasattr(recipients, "__len__"):
+            return len(recipients)
+        return None
+
+    def pending_recipients(self, recipients):
+        """
+        Yields recipients which haven't received this message yet.
+        Recipients are checked against delivery log in batches.
+        """
+        iterator = iter(recipients)
+        while True:
+            batch = list(islice(iterator, self.progress_batch_size))
+            if not batch:
+                return
+            delivered = set(
+                self.deliveries.filter(delivered=True, email__in=batch).values_list(
+                    "email", flat=True
+                )
+            )
+            for recipient in batch:
+                if recipient not in delivered:
+                    yield recipient
+
+    def send(self, recipients=None, force=False, resume=None, workers=None):
+        """
+        Sends message to all recipients, by default to all active users (see `mass_mailing_recipients()`).
+        Recipients may be any iterable of emails, they are consumed lazily. Flat `values_list()` querysets
+        (like the default one) are fetched in chunks of `recipients_chunk_size` with keyset pagination.
+
+        Every delivery is logged in MassEmailDelivery table. In resume mode, which is the default unless
+        `force` is used, recipients which already received the message are skipped, so interrupted mailing
+        can be continued with another `send()` call.
+        Progress is saved after every `progress_batch_size` recipients or `heartbeat_interval` seconds.
+        If the message was claimed by another worker in the meantime (see `MassEmailMessageQuerySet.claim()`),
+        sending stops and False is returned.
+        Messages are delivered by `workers` threads, see `deliver_messages()`.
+        """
         from emailtemplates.email import EmailFromTemplate
 
-        recipients = recipients or mass_mailing_recipients()
+        if not isinstance(recipients, models.QuerySet):
+            recipients = recipients or mass_mailing_recipients()
         if self.sent and not force:
             return False
+        if resume is None:
+            resume = not force
         eft = EmailFromTemplate(
             name="emailtemplates/mass_email.html",
             subject=self.subject,
@@ -148,22 +324,284 @@ class MassEmailMessage(models.Model):
         attachment_paths = [
             attachment.attachment_file.path for attachment in self.attachments.all()
         ]
-        sent_count = 0
-        for recipient in recipients:
-            sent = eft.send(to=[recipient], attachment_paths=attachment_paths)
-            if sent:
-                sent_count += 1
+        self.date_started = now()
+        self.date_finished = None
+        if isinstance(recipients, models.QuerySet):
+            # keyset pagination doesn't keep a cursor open for the whole mailing
+            recipients = (
+                ChunkedValuesIterable.from_queryset(
+                    recipients, chunk_size=self.recipients_chunk_size
+                )
+                or recipients
+            )
+        self.recipients_total = self.count_recipients(recipients)
+        if isinstance(recipients, models.QuerySet):
+            recipients = recipients.iterator(chunk_size=self.progress_batch_size)
+        self.recipients_sent = self.recipients_failed = 0
+        pending_recipients = recipients
+        if resume:
+            self.recipients_sent = self.deliveries.filter(delivered=True).count()
+            pending_recipients = self.pending_recipients(recipients)
+        self.save_progress(
+            "date_started", "date_finished", "recipients_total", check_claim=False
+        )
+        deliveries = []
+        last_heartbeat = time.monotonic()
+        for result in eft.send_to_each(
+            pending_recipients, attachment_paths=attachment_paths, workers=workers
+        ):
+            recipient = result.to[0]
+            if result.sent:
+                self.recipients_sent += 1
                 logger.info(
                     "Successfully sent mass email message to user %s", recipient
                 )
             else:
+                self.recipients_failed += 1
                 logger.warning("Error sending mass email message to user %s", recipient)
-        self.date_sent = now()
-        self.save()
-        return sent_count == len(recipients)
+            deliveries.append(
+                MassEmailDelivery(
+                    mass_email_message=self,
+                    email=recipient,
+                    delivered=bool(result.sent),
+                    error=str(result.error or ""),
+                )
+            )
+            if (
+                len(deliveries) >= self.progress_batch_size
+                or time.monotonic() - last_heartbeat >= self.heartbeat_interval
+            ):
+                MassEmailDelivery.objects.bulk_create(deliveries)
+                deliveries = []
+                if not self.save_progress():
+                    return self.claim_lost()
+                last_heartbeat = time.monotonic()
+        MassEmailDelivery.objects.bulk_create(deliveries)
+        self.date_sent = self.date_finished = now()
+        if not self.save_progress("date_sent", "date_finished"):
+            return self.claim_lost()
+        return self.recipients_failed == 0
+
+    def claim_lost(self):
+        logger.warning(
+            "Mass email message %s was claimed by another worker, stopping", self.pk
+        )
+        return False
+
+
+class MassEmailDelivery(models.Model):
+    """
+    Log of mass email message delivery to a single recipient.
+    """
+
+    id = models.BigAutoField(
+        auto_created=True, primary_key=True, serialize=False, verbose_name=_("ID")
+    )
+    mass_email_message = models.ForeignKey(
+        MassEmailMessage, related_name="deliveries", on_delete=models.CASCADE
+    )
+    email = models.CharField(_("email"), max_length=254)
+    delivered = models.BooleanField(_("delivered"), default=True)
+    error = models.TextField(_("error"), blank=True)
+    date_sent = models.DateTimeField(_("sent"), default=now)
+
+    class Meta:
+        verbose_name = _("Mass email delivery")
+        verbose_name_plural = _("Mass email deliveries")
+        indexes = [models.Index(fields=["mass_email_message", "email"])]
+
+    def __str__(self):
+        return self.email
 
 
 class MassEmailAttachment(BaseEmailAttachment):
     mass_email_message = models.ForeignKey(
         MassEmailMessage, related_name="attachments", on_delete=models.CASCADE
     )
+
+
+class OutboxMessageQuerySet(models.QuerySet):
+    def claim(
+        self,
+        batch_size=100,
+        retry_after=timedelta(minutes=1),
+        stale_after=timedelta(minutes=15),
+    ):
+        """
+        Claims batch of messages waiting for delivery and marks them as being sent.
+
+        Rows are locked with `SELECT ... FOR UPDATE SKIP LOCKED` where supported, so many workers can
+        claim messages in parallel without sending the same message twice. Messages which failed
+        are retried after `retry_after`. Messages claimed by a worker which didn't finish
+        within `stale_after` are claimed again.
+        """
+        current_time = now()
+        pending = (
+            Q(status=OutboxMessage.STATUS_QUEUED, claimed__isnull=True)
+            | Q(
+                status=OutboxMessage.STATUS_QUEUED,
+                claimed__lt=current_time - retry_after,
+            )
+            | Q(
+                status=OutboxMessage.STATUS_SENDING,
+                claimed__lt=current_time - stale_after,
+            )
+        )
+        with transaction.atomic():
+            queryset = self.filter(pending).order_by("pk")
+            if connections[self.db].features.has_select_for_update_skip_locked:
+                queryset = queryset.select_for_update(skip_locked=True)
+            pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+            self.filter(pk__in=pks).update(
+                status=OutboxMessage.STATUS_SENDING,
+                claimed=current_time,
+                attempts=F("attempts") + 1,
+            )
+        return list(self.filter(pk__in=pks).order_by("pk"))
+
+    def send_queued(
+        self, batch_size=100, max_attempts=3, connection=None, workers=None
+    ):
+        """
+        Claims and sends one batch of queued messages.
+
+        Messages which couldn't be sent are queued again, until they fail `max_attempts` times.
+
+        :return: tuple of numbers of sent and failed messages
+        """
+        from emailtemplates.delivery import deliver_messages
+
+        outbox_messages = self.claim(batch_size)
+        if not outbox_messages:
+            return 0, 0
+        results = deliver_messages(
+            (outbox_message.as_message() for outbox_message in outbox_messages),
+            connection=connection,
+            workers=workers,
+        )
+        sent_pks = []
+        failed_count = 0
+        for result, outbox_message in zip(results, outbox_messages):
+            if result.sent:
+                sent_pks.append(outbox_message.pk)
+                continue
+            failed_count += 1
+            if outbox_message.attempts >= max_attempts:
+                status = OutboxMessage.STATUS_FAILED
+            else:
+                status = OutboxMessage.STATUS_QUEUED
+            self.filter(pk=outbox_message.pk).update(
+                status=status, last_error=str(result.error or "")
+            )
+        self.filter(pk__in=sent_pks).update(
+            status=OutboxMessage.STATUS_SENT, date_sent=now(), last_error=""
+        )
+        return len(sent_pks), failed_count
+
+
+class OutboxMessage(models.Model):
+    """
+    Rendered email message waiting for delivery by `send_queued_emails` management command.
+    """
+
+    STATUS_QUEUED = "queued"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = (
+        (STATUS_QUEUED, _("queued")),
+        (STATUS_SENDING, _("sending")),
+        (STATUS_SENT, _("sent")),
+        (STATUS_FAILED, _("failed")),
+    )
+
+    id = models.BigAutoField(
+        auto_created=True, primary_key=True, serialize=False, verbose_name=_("ID")
+    )
+    template_name = models.CharField(_("template"), max_length=255, blank=True)
+    subject = models.TextField(_("subject"), blank=True)
+    body = models.TextField(_("content"), blank=True)
+    content_subtype = models.CharField(
+        _("content subtype"), max_length=20, default="html"
+    )
+    from_email = models.CharField(_("from email"), max_length=255)
+    to = models.JSONField(_("to"), default=list)
+    cc = models.JSONField(_("cc"), default=list, blank=True)
+    bcc = models.JSONField(_("bcc"), default=list, blank=True)
+    reply_to = models.JSONField(_("reply to"), default=list, blank=True)
+    headers = models.JSONField(_("headers"), default=dict, blank=True)
+    attachments = models.JSONField(_("attachments"), default=list, blank=True)
+    status = models.CharField(
+        _("status"),
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        db_index=True,
+    )
+    attempts = models.PositiveIntegerField(_("attempts"), default=0)
+    last_error = models.TextField(_("last error"), blank=True)
+    created = models.DateTimeField(_("created"), default=now)
+    claimed = models.DateTimeField(_("claimed"), null=True, blank=True)
+    date_sent = models.DateTimeField(_("sent"), null=True, blank=True)
+
+    objects = OutboxMessageQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Outbox message")
+        verbose_name_plural = _("Outbox messages")
+        ordering = ("-created",)
+
+    def __str__(self):
+        return self.subject
+
+    @classmethod
+    def from_message(cls, msg, template_name=""):
+        """
+        Creates (unsaved) outbox message from EmailMessage.
+        """
+        attachments = []
+        for attachment in msg.attachments:
+            if isinstance(attachment, MIMEBase):
+                raise ValueError("MIME attachments can't be queued")
+            filename, content, mimetype = attachment
+            if isinstance(content, str):
+                attachments.append([filename, content, mimetype, "text"])
+            else:
+                content = base64.b64encode(content).decode("ascii")
+                attachments.append([filename, content, mimetype, "base64"])
+        return cls(
+            template_name=template_name,
+            subject=msg.subject,
+            body=msg.body,
+            content_subtype=msg.content_subtype,
+            from_email=msg.from_email,
+            to=list(msg.to),
+            cc=list(msg.cc),
+            bcc=list(msg.bcc),
+            reply_to=list(msg.reply_to),
+            headers=dict(msg.extra_headers),
+            attachments=attachments,
+        )
+
+    def as_message(self, connection=None):
+        """
+        Returns EmailMessage ready to be sent.
+        """
+        msg = EmailMessage(
+            self.subject,
+            self.body,
+            self.from_email,
+            self.to,
+            self.bcc,
+            connection=connection,
+            cc=self.cc,
+            reply_to=self.reply_to,
+            headers=self.headers,
+        )
+        msg.content_subtype = self.content_subtype
+        msg.template_info = {"template_name": self.template_name}
+        for filename, content, mimetype, encoding in self.attachments:
+            if encoding == "base64":
+                content = base64.b64decode(content)
+            msg.attach(filename, content, mimetype)
+        return msg
@@ -0,0 +1,106 @@
+# coding=utf-8
+import cProfile
+import logging
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_lock = threading.Lock()
+
+
+def get_profile_dir():
+    return getattr(settings, "EMAILTEMPLATES_PROFILE_DIR", None) or os.path.join(
+        tempfile.gettempdir(), "emailtemplates-profiles"
+    )
+
+
+def get_profile_path(stage, template_name, language):
+    tag = re.sub(r"[^\w.-]+", "_", "%s-%s-%s" % (stage, template_name, language))
+    return os.path.join(
+        get_profile_dir(), "%d-%s.prof" % (time.time() * 1000000, tag.strip("_"))
+    )
+
+
+def prune_profiles():
+    """
+    Removes the oldest profiles, so at most EMAILTEMPLATES_PROFILE_MAX_FILES files are kept.
+    """
+    max_files = getattr(settings, "EMAILTEMPLATES_PROFILE_MAX_FILES", 20)
+    directory = get_profile_dir()
+    with _lock:
+        paths = sorted(
+            os.path.join(directory, name)
+            for name in os.listdir(directory)
+            if name.endswith(".prof")
+        )
+        for path in paths[: max(len(paths) - max_files, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def save_profile(profiler, stage, template_name, language):
+    path = get_profile_path(stage, template_name, language)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profiler.dump_stats(path)
+    prune_profiles()
+    return path
+
+
+@contextmanager
+def profiled(stage, template_name, language):
+    """
+    Profiles code inside with cProfile, for EMAILTEMPLATES_PROFILE_SAMPLE_RATE fraction of calls (0 by default).
+
+    Stats are saved only if the call took at least EMAILTEMPLATES_PROFILE_SLOW_THRESHOLD seconds (1 by default),
+    in EMAILTEMPLATES_PROFILE_DIR directory, in files named after stage, template name and language.
+    Only the newest EMAILTEMPLATES_PROFILE_MAX_FILES files are kept. Nested calls are profiled by the outer one.
+    """
+    sample_rate = getattr(settings, "EMAILTEMPLATES_PROFILE_SAMPLE_RATE", 0)
+    if (
+        not sample_rate
+        or getattr(_local, "active", False)
+        or random.random() >= sample_rate
+    ):
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # other profiler is active
+        yield
+        return
+    _local.active = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        _local.active = False
+        duration = time.perf_counter() - start
+        threshold = getattr(settings, "EMAILTEMPLATES_PROFILE_SLOW_THRESHOLD", 1.0)
+        if duration >= threshold:
+            try:
+                path = save_profile(profiler, stage, template_name, language)
+            except OSError as e:
+                logger.warning("Can't save profile of %s: %s", template_name, e)
+            else:
+                logger.warning(
+                    "Slow %s of %s template (%s): %.3fs, profile saved in %s",
+                    stage,
+                    template_name,
+                    language,
+                    duration,
+                    path,
+                )
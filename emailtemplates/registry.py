@@ -2,7 +2,7 @@
 import logging
 
 from django.template.loader import render_to_string
-from django.utils.translation import gettext_lazy as _
+from django.utils.translation import get_language, gettext_lazy as _
 
 logger = logging.getLogger(__name__)
 
@@ -49,54 +49,70 @@ class HelpContext(object):
 
 
 class RegistrationItem(object):
+    """
+    Registered email template. Help keys, values and context description are computed once, on registration,
+    form help text is computed once per language.
+    """
+
     def __init__(self, path, help_text="", help_context=None, name="", subject=""):
         self.name = name or path
         self.path = path
         self.help_text = help_text
         self.subject = subject
         self.help_context_obj = HelpContext(help_context)
+        self._help_keys = self.help_context_obj.get_help_keys()
+        self._help_values = self.help_context_obj.get_help_values()
+        self._context_description = self._get_context_description()
+        self._form_help_texts = {}
 
     @property
     def help_context(self):
-        return self.help_context_obj.get_help_keys()
+        return dict(self._help_keys)
 
     def _context_key(self, key):
         return "<b>{{ %s }}</b>" % key
 
     def context_description(self):
+        return self._context_description
+
+    def _get_context_description(self):
         help_text_item = (
             lambda k, v: "%s - %s" % (self._context_key(k), v)
             if v
             else "%s" % self._context_key(k)
         )
         return "<br/>".join(
-            [
-                help_text_item(k, v)
-                for (k, v) in sorted(self.help_context_obj.get_help_keys().items())
-            ]
+            [help_text_item(k, v) for (k, v) in sorted(self._help_keys.items())]
         )
 
     def as_form_help_text(self):
-        item_help_text = (
-            _("<b>USAGE: %s</b>") % self.help_text if self.help_text else ""
-        )
-        item_help_context = (
-            _("<b>CONTEXT:</b><br/>%s") % self.context_description()
-            if self.help_context_obj.get_help_keys()
-            else ""
-        )
-        return "<br/>".join((item_help_text, item_help_context))
+        language = get_language()
+        form_help_text = self._form_help_texts.get(language)
+        if form_help_text is None:
+            item_help_text = (
+                _("<b>USAGE: %s</b>") % self.help_text if self.help_text else ""
+            )
+            item_help_context = (
+                _("<b>CONTEXT:</b><br/>%s") % self.context_description()
+                if self._help_keys
+                else ""
+            )
+            form_help_text = "<br/>".join((item_help_text, item_help_context))
+            self._form_help_texts[language] = form_help_text
+        return form_help_text
 
     def as_form_choice(self):
         return self.path, self.name
 
     def get_help_content(self):
-        return self.help_context_obj.get_help_values()
+        # copy, because it's used as template context, which may be changed while rendering
+        return dict(self._help_values)
 
 
 class EmailTemplateRegistry(object):
     def __init__(self):
         self._registry = {}
+        self._form_help_texts = {}
 
     def register(self, path, name="", help_text=None, help_context=None, subject=""):
         """
@@ -164,16 +180,30 @@ class EmailTemplateRegistry(object):
     def get_form_help_text(self, path):
         """
         Returns text that can be used as form help text for creating email templates.
+        Rendered text is memoized per template path and active language.
         """
+        key = (path, get_language())
+        form_help_text = self._form_help_texts.get(key)
+        if form_help_text is not None:
+            return form_help_text
         try:
             form_help_text = render_to_string(
                 "admin/emailtemplates/_helptext.html",
                 context={"registration_item": self.get_registration(path)},
             )
         except NotRegistered:
-            form_help_text = ""
+            return ""
+        self._form_help_texts[key] = form_help_text
         return form_help_text
 
+    def clear_cache(self):
+        """
+        Drops memoized form help texts, e.g. after help text template change.
+        """
+        self._form_help_texts.clear()
+        for item in self.registration_items():
+            item._form_help_texts.clear()
+
 
 # Global object for singleton registry of email templates
 email_templates = EmailTemplateRegistry()
@@ -1,11 +1,15 @@
 # coding=utf-8
+from django.conf import settings
+
+from .delivery import DeliveryReport
 from .email import EmailFromTemplate
 
 
-def send_email(name, ctx_dict, send_to=None, subject="Subject", **kwargs):
+def send_email(name, ctx_dict, send_to=None, subject="Subject", queue=False, **kwargs):
     """
     Shortcut function for EmailFromTemplate class
 
+    @param queue: When it's True, message is saved in the outbox and sent later by `send_queued_emails` command
     @return: None
     """
 
@@ -14,4 +18,25 @@ def send_email(name, ctx_dict, send_to=None, subject="Subject", **kwargs):
     eft.context = ctx_dict
     eft.get_object()
     eft.render_message()
-    eft.send_email(send_to=send_to, **kwargs)
+    eft.send_email(send_to=send_to, queue=queue, **kwargs)
+
+
+def send_many(
+    name, recipients_with_context, language=None, subject="Subject", **kwargs
+):
+    """
+    Shortcut function sending the same template to many recipients, each with its own context.
+
+    Template is resolved and compiled once, `recipients_with_context` is consumed lazily and messages
+    are delivered over reused connections (see `EmailFromTemplate.send_batch()`).
+
+    Example usage:
+        report = send_many('hello.html', ((user.email, {'user': user}) for user in users))
+
+    @param recipients_with_context: iterable of (to, context) pairs, `to` is an email or list of emails
+    @param kwargs: kwargs passed to `EmailFromTemplate.send_batch()`, e.g. workers or fail_silently
+    @return: DeliveryReport with numbers of sent and failed messages and per-recipient results
+    """
+    eft = EmailFromTemplate(name=name, language=language or settings.LANGUAGE_CODE)
+    eft.subject = subject
+    return DeliveryReport(eft.send_batch(recipients_with_context, **kwargs))
@@ -0,0 +1,6 @@
+# coding=utf-8
+from django.dispatch import Signal
+
+# Sent when a stage of sending email (resolve, render, attachments, send) is finished.
+# Arguments: record - emailtemplates.timing.TimingRecord
+stage_timed = Signal()
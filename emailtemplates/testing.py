@@ -0,0 +1,56 @@
+# coding=utf-8
+"""
+Utilities for tests of projects sending email with emailtemplates.
+"""
+
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudget(ContextDecorator):
+    """
+    Context manager and decorator failing with AssertionError when code inside executes more than
+    `max_queries` database queries. Unlike TestCase.assertNumQueries(), fewer queries are allowed,
+    so the budget doesn't have to be updated on every optimization.
+
+    Usage with this class aliased to query_budget:
+    with query_budget(2):
+        eft.send(['to@example.com'])
+
+    @query_budget(0)
+    def test_form_init(self):
+        ...
+    """
+
+    def __init__(self, max_queries, using=DEFAULT_DB_ALIAS):
+        self.max_queries = max_queries
+        self.using = using
+        self.queries = None
+
+    def __enter__(self):
+        self.queries = CaptureQueriesContext(connections[self.using])
+        self.queries.__enter__()
+        return self.queries
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.queries.__exit__(exc_type, exc_value, traceback)
+        if exc_type is not None:
+            return
+        executed = len(self.queries)
+        if executed > self.max_queries:
+            raise AssertionError(
+                "%d queries executed, budget is %d\n%s"
+                % (
+                    executed,
+                    self.max_queries,
+                    "\n".join(
+                        "%d. %s" % (i, query["sql"])
+                        for i, query in enumerate(self.queries.captured_queries, 1)
+                    ),
+                )
+            )
+
+
+query_budget = QueryBudget
@@ -0,0 +1,299 @@
+# coding=utf-8
+"""
+End-to-end benchmarks of sending email with locmem email backend and SQLite.
+
+Run with:
+    python runtests.py --benchmark [--output results.json] [--repeat 3] [--quick]
+
+Results are printed (or saved) as JSON, one entry per benchmark case with messages per second,
+queries per message and peak memory, so runs made on different commits can be compared.
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from itertools import product
+
+import django
+from django.conf import settings
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.test.utils import (
+    CaptureQueriesContext,
+    get_runner,
+    override_settings,
+    setup_test_environment,
+    teardown_test_environment,
+)
+
+from ..cache import clear_caches
+from ..email import EmailFromTemplate
+from ..models import (
+    EmailAttachment,
+    EmailTemplate,
+    MassEmailAttachment,
+    MassEmailMessage,
+)
+from ..registry import email_templates
+from ..shortcuts import send_email
+
+TEMPLATE_NAME = "benchmark/template.html"
+TEMPLATE_SIZES = {"small": 1024, "large": 100 * 1024}
+ATTACHMENT_COUNTS = (0, 5)
+RECIPIENT_COUNTS = (1, 100)
+ATTACHMENT_SIZE = 16 * 1024
+
+
+def make_template_content(size):
+    """
+    Returns template mostly made of static HTML, with a few variables, of (at least) given size.
+    """
+    static = "<p>Lorem ipsum dolor sit amet, consectetur adipiscing elit.</p>\n" * 9
+    dynamic = "<p>Hello {{ user_name }}, your code is {{ code }}.</p>\n"
+    content = []
+    length = 0
+    while length < size:
+        content.extend([static, dynamic])
+        length += len(static) + len(dynamic)
+    return "".join(content)
+
+
+class BenchmarkFixture(object):
+    """
+    Template (in database or in filesystem) and attachments used by a benchmark case.
+    """
+
+    def __init__(self, source, template_size, attachments):
+        self.source = source
+        self.content = make_template_content(TEMPLATE_SIZES[template_size])
+        self.attachments = attachments
+        self.attachment_paths = []
+        self.directory = tempfile.mkdtemp()
+        self.overrides = override_settings(
+            MEDIA_ROOT=os.path.join(self.directory, "media"),
+            TEMPLATES=[
+                dict(
+                    settings.TEMPLATES[0],
+                    DIRS=[os.path.join(self.directory, "templates")],
+                )
+            ],
+        )
+
+    def __enter__(self):
+        self.overrides.enable()
+        clear_caches()
+        if not email_templates.is_registered(TEMPLATE_NAME):
+            email_templates.register(TEMPLATE_NAME, subject="Benchmark")
+        if self.source == "database":
+            self.setup_database_template()
+        else:
+            self.setup_filesystem_template()
+        self.mass_email_message = MassEmailMessage.objects.create(
+            subject="Benchmark", content=self.content
+        )
+        for i in range(self.attachments):
+            attachment = MassEmailAttachment(mass_email_message=self.mass_email_message)
+            attachment.attachment_file.save(
+                "mass-%d.txt" % i, ContentFile(b"x" * ATTACHMENT_SIZE)
+            )
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        EmailTemplate.objects.all().delete()
+        EmailAttachment.objects.all().delete()
+        MassEmailMessage.objects.all().delete()
+        self.overrides.disable()
+        clear_caches()
+        shutil.rmtree(self.directory)
+
+    def setup_database_template(self):
+        email_template = EmailTemplate.objects.create(
+            title=TEMPLATE_NAME,
+            language=settings.LANGUAGE_CODE,
+            subject="Hello {{ user_name }}",
+            content=self.content,
+        )
+        for i in range(self.attachments):
+            attachment = EmailAttachment(name="attachment %d" % i, send_as_link=False)
+            attachment.attachment_file.save(
+                "attachment-%d.txt" % i, ContentFile(b"x" * ATTACHMENT_SIZE)
+            )
+            email_template.attachments.add(attachment)
+
+    def setup_filesystem_template(self):
+        path = os.path.join(self.directory, "templates", TEMPLATE_NAME)
+        os.makedirs(os.path.dirname(path))
+        with open(path, "w") as f:
+            f.write(self.content)
+        for i in range(self.attachments):
+            path = os.path.join(self.directory, "attachment-%d.txt" % i)
+            with open(path, "wb") as f:
+                f.write(b"x" * ATTACHMENT_SIZE)
+            self.attachment_paths.append(path)
+
+
+def get_recipients(count):
+    return ["user%d@example.com" % i for i in range(count)]
+
+
+def get_context(recipient):
+    return {"user_name": recipient, "code": recipient.upper()}
+
+
+def send_benchmark(fixture, recipients):
+    for recipient in recipients:
+        eft = EmailFromTemplate(name=TEMPLATE_NAME)
+        eft.context = get_context(recipient)
+        eft.send([recipient], attachment_paths=fixture.attachment_paths)
+
+
+def shortcut_benchmark(fixture, recipients):
+    for recipient in recipients:
+        send_email(
+            TEMPLATE_NAME,
+            get_context(recipient),
+            [recipient],
+            attachment_paths=fixture.attachment_paths,
+        )
+
+
+def mass_send_benchmark(fixture, recipients):
+    fixture.mass_email_message.send(recipients, force=True)
+
+
+BENCHMARKS = {
+    "EmailFromTemplate.send": (send_benchmark, ("database", "filesystem")),
+    "shortcuts.send_email": (shortcut_benchmark, ("database", "filesystem")),
+    "MassEmailMessage.send": (mass_send_benchmark, ("database",)),
+}
+
+
+def measure(run, repeat):
+    """
+    Returns the best time of `repeat` runs, number of queries and peak memory of a single run.
+    Caches are warmed up by the first, not measured run.
+    """
+    mail.outbox = []
+    run()
+    seconds = []
+    for i in range(repeat):
+        mail.outbox = []
+        start = time.perf_counter()
+        run()
+        seconds.append(time.perf_counter() - start)
+    messages = len(mail.outbox)
+    mail.outbox = []
+    with CaptureQueriesContext(connection) as queries:
+        tracemalloc.start()
+        try:
+            run()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    mail.outbox = []
+    return min(seconds), messages, len(queries), peak_memory
+
+
+def run_benchmarks(repeat=3, quick=False):
+    results = []
+    template_sizes = ["small"] if quick else list(TEMPLATE_SIZES)
+    attachment_counts = ATTACHMENT_COUNTS[:1] if quick else ATTACHMENT_COUNTS
+    recipient_counts = RECIPIENT_COUNTS[-1:] if quick else RECIPIENT_COUNTS
+    for name, (benchmark, sources) in BENCHMARKS.items():
+        for source, template_size, attachments, recipient_count in product(
+            sources, template_sizes, attachment_counts, recipient_counts
+        ):
+            recipients = get_recipients(recipient_count)
+            with BenchmarkFixture(source, template_size, attachments) as fixture:
+                seconds, messages, queries, peak_memory = measure(
+                    lambda: benchmark(fixture, recipients), repeat
+                )
+            results.append(
+                {
+                    "benchmark": name,
+                    "source": source,
+                    "template_size": TEMPLATE_SIZES[template_size],
+                    "attachments": attachments,
+                    "recipients": recipient_count,
+                    "messages": messages,
+                    "seconds": seconds,
+                    "messages_per_second": messages / seconds if seconds else None,
+                    "queries_per_message": queries / messages if messages else None,
+                    "peak_memory_bytes": peak_memory,
+                }
+            )
+    return results
+
+
+def get_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(__file__),
+            stderr=subprocess.DEVNULL,
+            universal_newlines=True,
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+@contextmanager
+def test_database():
+    """
+    Sets up test environment (locmem email backend) and test database.
+    """
+    setup_test_environment()
+    test_runner = get_runner(settings)(verbosity=0)
+    old_config = test_runner.setup_databases()
+    try:
+        yield
+    finally:
+        test_runner.teardown_databases(old_config)
+        teardown_test_environment()
+
+
+def write_report(results, output=None, **extra):
+    report = json.dumps(
+        dict(
+            {
+                "revision": get_revision(),
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "results": results,
+            },
+            **extra
+        ),
+        indent=2,
+    )
+    if output:
+        with open(output, "w") as f:
+            f.write(report)
+    else:
+        sys.stdout.write(report + "\n")
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="runtests.py --benchmark")
+    parser.add_argument("--output", help="Save results to given file.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--quick", action="store_true", help="Run only a subset of cases."
+    )
+    options = parser.parse_args(argv)
+    # missing database templates are expected in filesystem cases
+    logging.disable(logging.WARNING)
+
+    with test_database():
+        results = run_benchmarks(repeat=options.repeat, quick=options.quick)
+    write_report(results, options.output)
+    return 0
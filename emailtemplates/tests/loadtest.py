@@ -0,0 +1,105 @@
+# coding=utf-8
+"""
+Load test of sending email through the real SMTP backend and a local SMTP sink with artificial latency.
+
+Run with:
+    python runtests.py --load-test [--latency 0.005] [--recipients 200] [--workers 1 4] [--output results.json]
+
+For every scenario messages per second and number of SMTP connections opened are reported as JSON.
+"""
+
+import argparse
+import logging
+import time
+
+from django.test.utils import override_settings
+
+from ..email import EmailFromTemplate
+from .benchmarks import (
+    TEMPLATE_NAME,
+    BenchmarkFixture,
+    get_context,
+    get_recipients,
+    test_database,
+    write_report,
+)
+from .smtp_sink import SMTPSink
+
+
+def send_scenario(fixture, recipients, workers):
+    for recipient in recipients:
+        eft = EmailFromTemplate(name=TEMPLATE_NAME)
+        eft.context = get_context(recipient)
+        eft.send([recipient])
+
+
+def send_batch_scenario(fixture, recipients, workers):
+    eft = EmailFromTemplate(name=TEMPLATE_NAME)
+    eft.send_batch(
+        ((recipient, get_context(recipient)) for recipient in recipients),
+        workers=workers,
+    )
+
+
+def mass_send_scenario(fixture, recipients, workers):
+    fixture.mass_email_message.send(recipients, force=True, workers=workers)
+
+
+SCENARIOS = {
+    "EmailFromTemplate.send": (send_scenario, False),
+    "EmailFromTemplate.send_batch": (send_batch_scenario, True),
+    "MassEmailMessage.send": (mass_send_scenario, True),
+}
+
+
+def run_load_tests(latency, recipient_count, workers_counts):
+    results = []
+    recipients = get_recipients(recipient_count)
+    with SMTPSink(latency=latency) as sink, override_settings(
+        EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+        EMAIL_HOST=sink.host,
+        EMAIL_PORT=sink.port,
+        EMAIL_USE_TLS=False,
+        EMAIL_USE_SSL=False,
+        EMAIL_HOST_USER="",
+        EMAIL_HOST_PASSWORD="",
+    ):
+        for name, (scenario, concurrent) in SCENARIOS.items():
+            for workers in workers_counts if concurrent else [1]:
+                with BenchmarkFixture("database", "small", 0) as fixture:
+                    sink.reset()
+                    start = time.perf_counter()
+                    scenario(fixture, recipients, workers)
+                    seconds = time.perf_counter() - start
+                results.append(
+                    {
+                        "scenario": name,
+                        "workers": workers,
+                        "recipients": recipient_count,
+                        "messages": sink.messages,
+                        "connections": sink.connections,
+                        "seconds": seconds,
+                        "messages_per_second": sink.messages / seconds,
+                    }
+                )
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(prog="runtests.py --load-test")
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=0.005,
+        help="Seconds added to every SMTP reply.",
+    )
+    parser.add_argument("--recipients", type=int, default=200)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--output", help="Save results to given file.")
+    options = parser.parse_args(argv)
+    logging.disable(logging.WARNING)
+
+    with test_database():
+        results = run_load_tests(options.latency, options.recipients, options.workers)
+    write_report(results, options.output, latency=options.latency)
+    return 0
@@ -0,0 +1,105 @@
+# coding=utf-8
+"""
+Minimal SMTP server accepting and discarding all messages, used by tests and load tests.
+"""
+
+import socketserver
+import threading
+import time
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        self.server.connection_opened()
+        self.reply(b"220 localhost SMTP sink")
+        messages = 0
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply(b"250-localhost\r\n250 8BITMIME")
+            elif command == b"MAIL" and messages == self.server.max_messages:
+                self.reply(b"421 Too many messages, closing connection")
+                break
+            elif command == b"DATA":
+                self.reply(b"354 End data with <CR><LF>.<CR><LF>")
+                for data_line in self.rfile:
+                    if data_line.rstrip(b"\r\n") == b".":
+                        break
+                self.server.message_received()
+                messages += 1
+                self.reply(b"250 OK")
+            elif command == b"QUIT":
+                self.reply(b"221 Bye")
+                break
+            else:
+                self.reply(b"250 OK")
+
+    def reply(self, response):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        self.wfile.write(response + b"\r\n")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    SMTP server listening on localhost, each connection is handled by its own thread.
+    Every reply is delayed by `latency` seconds to simulate network round trips.
+    With `max_messages` connections are closed with 421 reply after given number of messages.
+
+    Example usage:
+        with SMTPSink(latency=0.01) as sink:
+            with override_settings(EMAIL_BACKEND=..., EMAIL_HOST=sink.host, EMAIL_PORT=sink.port):
+                send()
+            print(sink.connections, sink.messages)
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, latency=0, host="127.0.0.1", port=0, max_messages=None):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.latency = latency
+        self.max_messages = max_messages
+        self.connections = 0
+        self.messages = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def host(self):
+        return self.server_address[0]
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def connection_opened(self):
+        with self._lock:
+            self.connections += 1
+
+    def message_received(self):
+        with self._lock:
+            self.messages += 1
+
+    def reset(self):
+        with self._lock:
+            self.connections = self.messages = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
@@ -0,0 +1,329 @@
+# coding=utf-8
+import os
+import shutil
+import tempfile
+import time
+
+import mock
+from django.template import Template
+from django.core.files.storage import FileSystemStorage
+from django.db import DatabaseError, transaction
+from django.test import TestCase, override_settings
+
+from ..cache import (
+    AttachmentCache,
+    LRUCache,
+    TemplateGenerations,
+    compiled_templates,
+    resolved_templates,
+    subject_templates,
+    clear_caches,
+)
+from ..email import EmailFromTemplate
+from ..models import EmailTemplate
+
+
+class LRUCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_discard(self):
+        cache = LRUCache()
+        cache.set(("a", "pl"), 1)
+        cache.set(("a", "en"), 2)
+        cache.set(("b", "pl"), 3)
+        cache.discard(lambda key: key[0] == "a")
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.get(("b", "pl")), 3)
+
+
+def enable_shared_cache(test_case):
+    """
+    Enables cache of template objects, with file based cache backend (shared between processes).
+    """
+    location = tempfile.mkdtemp()
+    test_case.addCleanup(shutil.rmtree, location)
+    settings_override = override_settings(
+        CACHES={
+            "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+            "emailtemplates": {
+                "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+                "LOCATION": location,
+            },
+        },
+        EMAILTEMPLATES_CACHE_ALIAS="emailtemplates",
+    )
+    settings_override.enable()
+    test_case.addCleanup(settings_override.disable)
+    clear_caches()
+
+
+class CompiledTemplateCacheTest(TestCase):
+    def setUp(self):
+        clear_caches()
+        self.email_template = EmailTemplate.objects.create(
+            title="cached.html",
+            language="pl",
+            subject="Hi",
+            content="Hello {{ name }}",
+        )
+
+    def render(self, name="John"):
+        eft = EmailFromTemplate(
+            name="cached.html", language="pl", registry_validation=False
+        )
+        eft.context = {"name": name}
+        eft.get_object()
+        eft.render_message()
+        return eft.message
+
+    def test_template_is_compiled_once(self):
+        with mock.patch("emailtemplates.cache.Template", wraps=Template) as mock_tpl:
+            self.assertEqual(self.render("John"), "Hello John")
+            self.assertEqual(self.render("Paul"), "Hello Paul")
+        self.assertEqual(mock_tpl.call_count, 1)
+
+    def test_cache_invalidated_on_save(self):
+        self.assertEqual(self.render(), "Hello John")
+        self.email_template.content = "Bye {{ name }}"
+        self.email_template.save()
+        self.assertEqual(len(compiled_templates._cache), 0)
+        self.assertEqual(self.render(), "Bye John")
+
+    def test_cache_invalidated_on_delete(self):
+        self.render()
+        self.email_template.delete()
+        self.assertEqual(len(compiled_templates._cache), 0)
+
+    @override_settings(EMAILTEMPLATES_CACHE_ALIAS=None)
+    def test_content_updated_without_signals(self):
+        self.assertEqual(self.render(), "Hello John")
+        EmailTemplate.objects.filter(pk=self.email_template.pk).update(
+            content="Bye {{ name }}"
+        )
+        self.assertEqual(self.render(), "Bye John")
+
+
+class ResolvedTemplateCacheTest(TestCase):
+    def setUp(self):
+        enable_shared_cache(self)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.email_template = EmailTemplate.objects.create(
+                title="cached.html",
+                language="pl",
+                subject="Hi",
+                content="Hello {{ name }}",
+            )
+
+    def get_template_object(self):
+        eft = EmailFromTemplate(
+            name="cached.html", language="pl", registry_validation=False
+        )
+        return eft.get_template_object()
+
+    def test_cached_object_is_returned_without_queries(self):
+        with self.assertNumQueries(2):
+            self.get_template_object()
+        with self.assertNumQueries(0):
+            template_object = self.get_template_object()
+        self.assertEqual(template_object.pk, self.email_template.pk)
+
+    def test_generation_bumped_by_other_process(self):
+        self.get_template_object()
+        EmailTemplate.objects.filter(pk=self.email_template.pk).update(
+            content="Bye {{ name }}"
+        )
+        self.assertEqual(self.get_template_object().content, "Hello {{ name }}")
+        resolved_templates.generations.bump("cached.html", ["pl"])
+        self.assertEqual(self.get_template_object().content, "Bye {{ name }}")
+
+    def test_save_bumps_generation(self):
+        generation = resolved_templates.generations.get("cached.html", ["pl"])
+        self.email_template.save()
+        self.assertNotEqual(
+            resolved_templates.generations.get("cached.html", ["pl"]), generation
+        )
+
+    def test_object_expires(self):
+        self.get_template_object()
+        expired = time.monotonic() + 61
+        with mock.patch("emailtemplates.cache.time.monotonic", return_value=expired):
+            with self.assertNumQueries(2):
+                self.get_template_object()
+
+    def test_not_cached_until_commit(self):
+        self.email_template.content = "Bye {{ name }}"
+        self.email_template.save()
+        self.get_template_object()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.get_template_object().content, "Bye {{ name }}")
+
+    def test_rolled_back_change_is_not_cached(self):
+        try:
+            with transaction.atomic():
+                self.email_template.content = "Bye {{ name }}"
+                self.email_template.save()
+                self.assertEqual(self.get_template_object().content, "Bye {{ name }}")
+                raise DatabaseError
+        except DatabaseError:
+            pass
+        self.assertEqual(self.get_template_object().content, "Hello {{ name }}")
+
+    def test_cache_backend_down(self):
+        self.get_template_object()
+        broken_cache = mock.Mock()
+        broken_cache.get_many.side_effect = ConnectionError
+        broken_cache.set_many.side_effect = ConnectionError
+        with mock.patch.object(
+            TemplateGenerations, "cache", mock.PropertyMock(return_value=broken_cache)
+        ), mock.patch("emailtemplates.cache.logger"):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.get_template_object().pk, self.email_template.pk)
+            with self.assertNumQueries(2):
+                self.get_template_object()
+            self.email_template.save()
+
+    @override_settings(EMAILTEMPLATES_CACHE_ALIAS=None)
+    def test_disabled(self):
+        self.get_template_object()
+        with self.assertNumQueries(2):
+            self.get_template_object()
+
+    @override_settings(EMAILTEMPLATES_CACHE_ALIAS="default")
+    def test_disabled_with_local_backend(self):
+        self.assertFalse(resolved_templates.enabled)
+        self.get_template_object()
+        with self.assertNumQueries(2):
+            self.get_template_object()
+
+
+class SubjectTemplateCacheTest(TestCase):
+    def setUp(self):
+        clear_caches()
+
+    def test_static_subject_is_not_compiled(self):
+        self.assertIsNone(subject_templates.get_template("Welcome!"))
+        self.assertIsNotNone(subject_templates.get_template("Hi {{ name }}"))
+        self.assertIsNotNone(subject_templates.get_template("Hi {# name #}"))
+
+    def test_subject_is_compiled_once(self):
+        EmailTemplate.objects.create(
+            title="subject.html",
+            language="pl",
+            subject="Hi {{ name }}",
+            content="Hello",
+        )
+        with mock.patch("emailtemplates.cache.Template", wraps=Template) as mock_tpl:
+            for name in ("John", "Paul"):
+                eft = EmailFromTemplate(
+                    name="subject.html", language="pl", registry_validation=False
+                )
+                eft.context = {"name": name}
+                eft.get_object()
+                self.assertEqual(eft.subject, "Hi %s" % name)
+        subject_calls = [
+            c for c in mock_tpl.call_args_list if c[0] == ("Hi {{ name }}",)
+        ]
+        self.assertEqual(len(subject_calls), 1)
+
+
+class MissingTemplateCacheTest(TestCase):
+    def setUp(self):
+        enable_shared_cache(self)
+
+    def get_object(self):
+        eft = EmailFromTemplate(
+            name="missing.html", language="pl", registry_validation=False
+        )
+        eft.get_object()
+        return eft
+
+    def test_missing_template_is_cached(self):
+        with self.assertNumQueries(1):
+            self.get_object()
+        with self.assertNumQueries(0):
+            eft = self.get_object()
+        self.assertNotEqual(eft.template_source, "database")
+
+    def test_created_template_drops_negative_entry(self):
+        self.get_object()
+        EmailTemplate.objects.create(
+            title="missing.html", language="pl", subject="Hi", content="Hello"
+        )
+        eft = self.get_object()
+        self.assertEqual(eft.template_source, "database")
+
+    def test_negative_entry_expires(self):
+        self.get_object()
+        expired = time.monotonic() + 301
+        with mock.patch("emailtemplates.cache.time.monotonic", return_value=expired):
+            with self.assertNumQueries(1):
+                self.get_object()
+
+    @override_settings(EMAILTEMPLATES_MISSING_TEMPLATE_TTL=0)
+    def test_negative_cache_disabled(self):
+        self.get_object()
+        with self.assertNumQueries(1):
+            self.get_object()
+
+
+class AttachmentCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = AttachmentCache(max_bytes=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, "wb") as f:
+            f.write(content)
+        return path
+
+    def test_get_path(self):
+        path = self.write("a.txt", b"abc")
+        self.assertEqual(self.cache.get_path(path), b"abc")
+        self.assertEqual(len(self.cache), 1)
+        with mock.patch("emailtemplates.cache.open") as mock_open:
+            self.assertEqual(self.cache.get_path(path), b"abc")
+        mock_open.assert_not_called()
+
+    def test_changed_file_is_read_again(self):
+        path = self.write("a.txt", b"abc")
+        self.cache.get_path(path)
+        self.write("a.txt", b"abcd")
+        self.assertEqual(self.cache.get_path(path), b"abcd")
+
+    def test_get_storage_file(self):
+        self.write("a.txt", b"abc")
+        storage = FileSystemStorage(location=self.directory)
+        self.assertEqual(self.cache.get_storage_file(storage, "a.txt"), b"abc")
+        with mock.patch.object(storage, "open") as mock_open:
+            self.assertEqual(self.cache.get_storage_file(storage, "a.txt"), b"abc")
+        mock_open.assert_not_called()
+
+    def test_total_size_limit(self):
+        first = self.write("a.txt", b"aaaa")
+        second = self.write("b.txt", b"bbbb")
+        third = self.write("c.txt", b"cccc")
+        for path in (first, second, first, third):
+            self.cache.get_path(path)
+        self.assertEqual(len(self.cache), 2)
+        self.assertEqual(self.cache.size, 8)
+        with mock.patch("emailtemplates.cache.open") as mock_open:
+            self.cache.get_path(first)
+        mock_open.assert_not_called()
+
+    def test_large_file_is_not_cached(self):
+        path = self.write("a.txt", b"a" * 11)
+        self.assertEqual(self.cache.get_path(path), b"a" * 11)
+        self.assertEqual(len(self.cache), 0)
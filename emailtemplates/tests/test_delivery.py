@@ -0,0 +1,138 @@
+# coding=utf-8
+from smtplib import SMTPException
+
+import mock
+from django.core import mail
+from django.core.mail import EmailMessage
+from django.test import TestCase, override_settings
+
+from ..delivery import deliver_messages, get_delivery_workers
+from ..models import MassEmailMessage
+from .smtp_sink import SMTPSink
+
+
+def get_messages(count):
+    return [
+        EmailMessage("Subject", "Body", "from@example.com", ["to%d@example.com" % i])
+        for i in range(count)
+    ]
+
+
+def failing_connection():
+    def send_messages(messages):
+        if messages[0].to == ["to3@example.com"]:
+            raise SMTPException("error")
+        return len(messages)
+
+    connection = mock.Mock()
+    connection.send_messages.side_effect = send_messages
+    return connection
+
+
+@mock.patch("emailtemplates.delivery.logger", mock.Mock())
+class DeliverMessagesTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+
+    def test_sequential(self):
+        with mock.patch(
+            "emailtemplates.delivery.get_connection", wraps=mail.get_connection
+        ) as mock_get_connection:
+            results = list(deliver_messages(get_messages(3)))
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual([result.sent for result in results], [1, 1, 1])
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_concurrent_results_in_order(self):
+        results = list(deliver_messages(get_messages(20), workers=4))
+        self.assertEqual(
+            [result.to for result in results],
+            [["to%d@example.com" % i] for i in range(20)],
+        )
+        self.assertEqual(len(mail.outbox), 20)
+
+    def test_concurrent_connection_per_worker(self):
+        connections = []
+
+        def get_connection():
+            connection = failing_connection()
+            connections.append(connection)
+            return connection
+
+        with mock.patch(
+            "emailtemplates.delivery.get_connection", side_effect=get_connection
+        ):
+            results = list(deliver_messages(get_messages(10), workers=3))
+        self.assertTrue(1 <= len(connections) <= 3)
+        for connection in connections:
+            connection.open.assert_called_once_with()
+            connection.close.assert_called_once_with()
+        self.assertEqual(
+            [i for i, result in enumerate(results) if result.error is not None], [3]
+        )
+        self.assertEqual(sum(result.sent for result in results), 9)
+
+    def test_concurrent_fail_loudly(self):
+        with mock.patch(
+            "emailtemplates.delivery.get_connection", side_effect=failing_connection
+        ):
+            with self.assertRaises(SMTPException):
+                list(deliver_messages(get_messages(10), fail_silently=False, workers=2))
+
+    @override_settings(EMAILTEMPLATES_DELIVERY_WORKERS=4)
+    def test_get_delivery_workers(self):
+        self.assertEqual(get_delivery_workers(), 4)
+        self.assertEqual(get_delivery_workers(2), 2)
+        self.assertEqual(get_delivery_workers(0), 1)
+
+
+@mock.patch("emailtemplates.delivery.logger", mock.Mock())
+class SMTPDeliveryTest(TestCase):
+    def setUp(self):
+        self.sink = SMTPSink()
+        self.sink.start()
+        self.settings_override = override_settings(
+            EMAIL_BACKEND="django.core.mail.backends.smtp.EmailBackend",
+            EMAIL_HOST=self.sink.host,
+            EMAIL_PORT=self.sink.port,
+        )
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.sink.stop()
+
+    def test_sequential(self):
+        results = list(deliver_messages(get_messages(5)))
+        self.assertEqual([result.sent for result in results], [1] * 5)
+        self.assertEqual(self.sink.messages, 5)
+        self.assertEqual(self.sink.connections, 1)
+
+    def test_concurrent(self):
+        results = list(deliver_messages(get_messages(20), workers=3))
+        self.assertEqual([result.sent for result in results], [1] * 20)
+        self.assertEqual(self.sink.messages, 20)
+        self.assertLessEqual(self.sink.connections, 3)
+
+    def test_sequential_reconnect(self):
+        self.sink.max_messages = 3
+        results = list(deliver_messages(get_messages(10)))
+        self.assertEqual([result.sent for result in results], [1] * 10)
+        self.assertEqual(self.sink.messages, 10)
+        self.assertEqual(self.sink.connections, 4)
+
+    def test_concurrent_reconnect(self):
+        self.sink.max_messages = 3
+        results = list(deliver_messages(get_messages(10), workers=3))
+        self.assertEqual([result.sent for result in results], [1] * 10)
+        self.assertEqual(self.sink.messages, 10)
+
+    def test_mass_email_reconnect(self):
+        self.sink.max_messages = 3
+        mass_email_message = MassEmailMessage.objects.create(
+            subject="Hi", content="Hello"
+        )
+        mass_email_message.send(["to%d@example.com" % i for i in range(10)])
+        self.assertEqual(mass_email_message.recipients_sent, 10)
+        self.assertEqual(mass_email_message.recipients_failed, 0)
+        self.assertEqual(self.sink.messages, 10)
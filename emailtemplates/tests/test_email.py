@@ -1,17 +1,26 @@
 # coding=utf-8
+import itertools
 import os
+import shutil
+from smtplib import SMTPException
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 
 import mock
 from django.conf import settings
 from django.core import mail
+from django.core.files.base import ContentFile
+from django.template import Template
 from django.test import TestCase, override_settings
 from django.utils.html import escape
 from mock import Mock
 
-from ..email import EmailFromTemplate
+from ..cache import clear_caches
+from ..email import EmailFromTemplate, RenderedEmail
 from ..email import logger as email_logger
 from ..models import EmailTemplate, EmailAttachment
 from ..registry import email_templates, NotRegistered, EmailTemplateRegistry
+from .test_cache import enable_shared_cache
 
 
 class CheckEmail(TestCase):
@@ -56,6 +65,16 @@ class EmailFromTemplateTest(CheckEmail):
         eft.send_email(to)
         self.check_email_was_sent(eft, to)
 
+    def test_without_language(self):
+        eft = EmailFromTemplate(
+            registry_validation=False, name="template.html", language=None
+        )
+        eft.get_object()
+        self.assertEqual(eft.template_source, "default")
+        to = ["to@example.com"]
+        self.assertTrue(eft.send(to))
+        self.check_email_was_sent(eft, to)
+
     @mock.patch("emailtemplates.email.logger")
     def test_with_empty_db_object(self, mock_logger):
         eft = EmailFromTemplate(registry_validation=False, name="template.html")
@@ -168,3 +187,320 @@ class EmailFromTemplateWithFixturesTest(CheckEmail):
         self.assertEqual(eft.template_source, "default")
         eft.send_email(to)
         self.check_email_was_sent(eft, to)
+
+
+class EmailFromTemplateQueriesTest(CheckEmail):
+    def setUp(self):
+        enable_shared_cache(self)
+        mail.outbox = []
+        self.media_root = tempfile.mkdtemp()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.email_template = EmailTemplate.objects.create(
+                title="queries.html",
+                language="pl",
+                subject="Hi {{ user_name }}",
+                content="Hello {{ user_name }} "
+                "{% for name, url in default_attachments %}{{ url }}{% endfor %}",
+            )
+            with override_settings(MEDIA_ROOT=self.media_root):
+                inline_attachment = EmailAttachment(name="inline", send_as_link=False)
+                inline_attachment.attachment_file.save(
+                    "inline.txt", ContentFile(b"inline content"), save=True
+                )
+            link_attachment = EmailAttachment.objects.create(
+                name="link", attachment_file="test/link.pdf", send_as_link=True
+            )
+            self.email_template.attachments.add(inline_attachment, link_attachment)
+
+    def tearDown(self):
+        shutil.rmtree(self.media_root)
+
+    def send(self):
+        with override_settings(MEDIA_ROOT=self.media_root):
+            eft = EmailFromTemplate(
+                name="queries.html", language="pl", registry_validation=False
+            )
+            eft.context = {"user_name": "Lucas"}
+            eft.send(["to@example.com"])
+        return eft
+
+    def test_send_queries(self):
+        with self.assertNumQueries(2):
+            eft = self.send()
+        self.check_email_was_sent(eft, ["to@example.com"])
+        self.assertEqual(eft.subject, "Hi Lucas")
+        self.assertIn("test/link.pdf", eft.message)
+        self.assertEqual(mail.outbox[0].attachments[0][1], "inline content")
+
+    def test_send_cached_template_queries(self):
+        self.send()
+        with self.assertNumQueries(0):
+            self.send()
+        self.assertEqual(mail.outbox[1].attachments[0][1], "inline content")
+
+    @override_settings(EMAILTEMPLATES_CACHE_ALIAS=None)
+    def test_send_without_object_cache_queries(self):
+        self.send()
+        with self.assertNumQueries(2):
+            self.send()
+
+    def test_send_batch_queries(self):
+        eft = EmailFromTemplate(
+            name="queries.html", language="pl", registry_validation=False
+        )
+        with override_settings(MEDIA_ROOT=self.media_root), self.assertNumQueries(2):
+            eft.send_batch(
+                ("to%d@example.com" % i, {"user_name": i}) for i in range(20)
+            )
+        self.assertEqual(len(mail.outbox), 20)
+
+    def test_default_attachments_evaluated_once(self):
+        with mock.patch.object(
+            EmailFromTemplate,
+            "build_absolute_uri",
+            autospec=True,
+            side_effect=EmailFromTemplate.build_absolute_uri,
+        ) as mock_build_absolute_uri:
+            eft = self.send()
+            with override_settings(MEDIA_ROOT=self.media_root):
+                messages = list(
+                    eft.iter_messages(
+                        ("%d@example.com" % i, {"user_name": i}) for i in range(3)
+                    )
+                )
+        self.assertEqual(mock_build_absolute_uri.call_count, 2)
+        self.assertIn("test/link.pdf", eft.message)
+        self.assertIn("test/link.pdf", messages[2].body)
+
+    def test_default_attachments_not_evaluated_when_unused(self):
+        self.email_template.content = "Hello {{ user_name }}"
+        self.email_template.save()
+        with mock.patch.object(
+            EmailFromTemplate, "build_absolute_uri"
+        ) as mock_build_absolute_uri:
+            eft = self.send()
+        self.assertEqual(eft.message, "Hello Lucas")
+        self.assertFalse(mock_build_absolute_uri.called)
+
+    def test_attachments_change_invalidates_template(self):
+        self.send()
+        self.email_template.attachments.clear()
+        self.send()
+        self.assertEqual(mail.outbox[1].attachments, [])
+
+
+@override_settings(LANGUAGE_CODE="en-us")
+class EmailFromTemplateLanguageFallbackTest(TestCase):
+    def setUp(self):
+        for language in ("en-us", "de"):
+            EmailTemplate.objects.create(
+                title="fallback.html",
+                language=language,
+                subject="Subject",
+                content="Content %s" % language,
+            )
+
+    def get_object(self, language):
+        eft = EmailFromTemplate(
+            name="fallback.html", language=language, registry_validation=False
+        )
+        eft.get_object()
+        return eft
+
+    def test_exact_language(self):
+        self.assertEqual(self.get_object("de").template, "Content de")
+
+    def test_generic_language_fallback(self):
+        with self.assertNumQueries(2):
+            eft = self.get_object("de-at")
+        self.assertEqual(eft.template, "Content de")
+        self.assertEqual(eft.template_source, "database")
+
+    def test_default_language_fallback(self):
+        self.assertEqual(self.get_object("pl").template, "Content en-us")
+
+    def test_fallback_template_change_invalidates_cache(self):
+        self.get_object("de-at")
+        EmailTemplate.objects.create(
+            title="fallback.html",
+            language="de-at",
+            subject="Subject",
+            content="Content de-at",
+        )
+        self.assertEqual(self.get_object("de-at").template, "Content de-at")
+
+    @override_settings(EMAILTEMPLATES_LANGUAGE_FALLBACKS={"pl": []})
+    def test_no_fallback(self):
+        self.assertEqual(self.get_object("pl").template_source, "default")
+
+
+class EmailFromTemplateSendBatchTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        EmailTemplate.objects.create(
+            title="batch.html",
+            language="pl",
+            subject="Hi {{ user_name }}",
+            content="Hello {{ user_name }}",
+        )
+        self.recipients = [
+            ("john@example.com", {"user_name": "John"}),
+            (["paul@example.com"], {"user_name": "Paul"}),
+        ]
+
+    def get_eft(self):
+        return EmailFromTemplate(
+            name="batch.html", language="pl", registry_validation=False
+        )
+
+    def test_send_batch(self):
+        with mock.patch(
+            "emailtemplates.delivery.get_connection", wraps=mail.get_connection
+        ) as mock_get_connection:
+            results = self.get_eft().send_batch(self.recipients)
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual(
+            [(result.to, result.sent, result.error) for result in results],
+            [(["john@example.com"], 1, None), (["paul@example.com"], 1, None)],
+        )
+        self.assertEqual(
+            [(msg.to, msg.subject, msg.body) for msg in mail.outbox],
+            [
+                (["john@example.com"], "Hi John", "Hello John"),
+                (["paul@example.com"], "Hi Paul", "Hello Paul"),
+            ],
+        )
+
+    def test_send_batch_reports_failures(self):
+        error = SMTPException("error")
+        connection = Mock()
+        connection.send_messages.side_effect = [error, 1]
+        results = self.get_eft().send_batch(self.recipients, connection=connection)
+        self.assertEqual(results[0].sent, 0)
+        self.assertEqual(results[0].error, error)
+        self.assertEqual(results[1].sent, 1)
+        connection.close.assert_called_once_with()
+
+    def test_send_batch_fail_loudly(self):
+        connection = Mock()
+        connection.send_messages.side_effect = SMTPException("error")
+        with self.assertRaises(SMTPException):
+            self.get_eft().send_batch(
+                self.recipients, connection=connection, fail_silently=False
+            )
+
+
+class EmailFromTemplateIterMessagesTest(TestCase):
+    def setUp(self):
+        # compiled subjects are cached per process, see test_iter_messages
+        clear_caches()
+        mail.outbox = []
+        EmailTemplate.objects.create(
+            title="iter.html",
+            language="pl",
+            subject="Hi {{ user_name }}",
+            content="Hello {{ user_name }}",
+        )
+
+    def test_iter_messages(self):
+        eft = EmailFromTemplate(
+            name="iter.html", language="pl", registry_validation=False
+        )
+        recipients = (
+            ("user%d@example.com" % i, {"user_name": "User %d" % i})
+            for i in itertools.count()
+        )
+        with mock.patch(
+            "emailtemplates.cache.Template", wraps=Template
+        ) as mock_template:
+            messages = list(itertools.islice(eft.iter_messages(recipients), 3))
+        self.assertEqual(
+            [(msg.to, msg.subject, msg.body) for msg in messages],
+            [
+                (["user%d@example.com" % i], "Hi User %d" % i, "Hello User %d" % i)
+                for i in range(3)
+            ],
+        )
+        self.assertEqual(messages[0].content_subtype, "html")
+        self.assertEqual(mail.outbox, [])
+        # content and subject compiled once
+        self.assertEqual(mock_template.call_count, 2)
+
+
+class ResolvedTemplateTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        EmailTemplate.objects.create(
+            title="resolved.html",
+            language="pl",
+            subject="Hi {{ user_name }}",
+            content="Hello {{ user_name }}",
+        )
+        self.eft = EmailFromTemplate(
+            name="resolved.html", language="pl", registry_validation=False
+        )
+
+    def test_resolve_does_not_change_instance(self):
+        resolved = self.eft.resolve()
+        self.assertEqual(resolved.template_source, "database")
+        self.assertEqual(
+            resolved.render({"user_name": "Lucas"}),
+            RenderedEmail("Hi Lucas", "Hello Lucas"),
+        )
+        self.assertEqual(self.eft.subject, "")
+        self.assertEqual(self.eft.message, "")
+        self.assertIsNone(self.eft.compiled_template)
+        self.assertEqual(self.eft.template_source, "default")
+
+    def test_shared_between_threads(self):
+        resolved = self.eft.resolve()
+        names = ["User %d" % i for i in range(50)]
+
+        def render(name):
+            return resolved.get_message(["%s@example.com" % name], {"user_name": name})
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            messages = list(executor.map(render, names))
+        self.assertEqual(
+            [(msg.subject, msg.body) for msg in messages],
+            [("Hi %s" % name, "Hello %s" % name) for name in names],
+        )
+        self.assertEqual(messages[0].content_subtype, "html")
+
+    def test_send_uses_overridden_hooks(self):
+        class CustomEmailFromTemplate(EmailFromTemplate):
+            def get_subject(self, template):
+                return "Custom subject"
+
+            def get_context(self):
+                context = super().get_context()
+                context["user_name"] = "Custom user"
+                return context
+
+            def get_default_attachments(self, as_links=False):
+                if as_links:
+                    return []
+                return [("custom.txt", "custom content", "text/plain")]
+
+        eft = CustomEmailFromTemplate(
+            name="resolved.html", language="pl", registry_validation=False
+        )
+        eft.send(["to@example.com"])
+        msg = mail.outbox[0]
+        self.assertEqual(msg.subject, "Custom subject")
+        self.assertEqual(msg.body, "Hello Custom user")
+        self.assertEqual(
+            msg.attachments, [("custom.txt", "custom content", "text/plain")]
+        )
+
+    def test_get_object_keeps_legacy_attributes(self):
+        self.eft.context = {"user_name": "Lucas"}
+        self.eft.get_object()
+        self.eft.render_message()
+        self.assertEqual(self.eft.subject, "Hi Lucas")
+        self.assertEqual(self.eft.message, "Hello Lucas")
+        self.assertEqual(self.eft.template, "Hello {{ user_name }}")
+        self.assertEqual(self.eft.template_source, "database")
+        self.assertIs(
+            self.eft.resolved_template.compiled_template, self.eft.compiled_template
+        )
@@ -1,7 +1,12 @@
 # encoding: utf-8
 from django.contrib.auth import get_user_model
+from django.db.models import QuerySet
 from django.test import TestCase, override_settings
-from emailtemplates.helpers import mass_mailing_recipients
+from emailtemplates.helpers import (
+    ChunkedValuesIterable,
+    mass_mailing_recipients,
+    language_fallbacks,
+)
 
 
 def recipients_test_function():
@@ -14,7 +19,11 @@ class HelpersTest(TestCase):
         User.objects.create(username="mike", email="mike@example.com", is_active=True)
         User.objects.create(username="john", email="john@example.com", is_active=False)
         User.objects.create(username="paul", is_active=True)
-        self.assertEqual(list(mass_mailing_recipients()), ["mike@example.com"])
+        recipients = mass_mailing_recipients()
+        self.assertIsInstance(recipients, QuerySet)
+        self.assertEqual(list(recipients), ["mike@example.com"])
+        self.assertEqual(len(recipients), 1)
+        self.assertTrue(recipients.filter(email__startswith="mike").exists())
 
     @override_settings(
         MASS_EMAIL_RECIPIENTS="emailtemplates.tests.test_helpers.recipients_test_function"
@@ -23,3 +32,44 @@ class HelpersTest(TestCase):
         self.assertEqual(
             mass_mailing_recipients(), ["user@example.com", "another@example.com"]
         )
+
+    @override_settings(LANGUAGE_CODE="en-us")
+    def test_language_fallbacks(self):
+        self.assertEqual(language_fallbacks("de-at"), ["de-at", "de", "en-us"])
+        self.assertEqual(language_fallbacks("en-us"), ["en-us", "en"])
+        self.assertEqual(language_fallbacks("pl"), ["pl", "en-us"])
+        self.assertEqual(language_fallbacks(None), ["en-us"])
+
+    @override_settings(EMAILTEMPLATES_LANGUAGE_FALLBACKS={"de-at": ["de"], "pl": []})
+    def test_language_fallbacks_from_settings(self):
+        self.assertEqual(language_fallbacks("de-at"), ["de-at", "de"])
+        self.assertEqual(language_fallbacks("pl"), ["pl"])
+
+    def test_chunked_values_iterable(self):
+        User = get_user_model()
+        for i, email in enumerate(["c@example.com", "a@example.com", "b@example.com"]):
+            User.objects.create(username="user%d" % i, email=email)
+        User.objects.create(username="duplicate", email="a@example.com")
+        recipients = ChunkedValuesIterable(User.objects.all(), "email", chunk_size=2)
+        with self.assertNumQueries(2):
+            self.assertEqual(
+                list(recipients), ["a@example.com", "b@example.com", "c@example.com"]
+            )
+        self.assertEqual(recipients.count(), 3)
+
+    def test_chunked_values_iterable_from_queryset(self):
+        User = get_user_model()
+        self.assertIsNotNone(
+            ChunkedValuesIterable.from_queryset(
+                User.objects.values_list("email", flat=True)
+            )
+        )
+        self.assertIsNone(ChunkedValuesIterable.from_queryset(User.objects.all()))
+        self.assertIsNone(
+            ChunkedValuesIterable.from_queryset(User.objects.values_list("email"))
+        )
+        self.assertIsNone(
+            ChunkedValuesIterable.from_queryset(
+                User.objects.values_list("email", flat=True)[:10]
+            )
+        )
@@ -2,14 +2,28 @@
 from __future__ import unicode_literals
 
 import os
+from datetime import timedelta
+from smtplib import SMTPException
 
 import mock
+from django.contrib.auth import get_user_model
 from django.core import mail
+from django.core.management import call_command
 from django.core.files import File
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils.timezone import now
 
+from emailtemplates.email import EmailFromTemplate, ResolvedTemplate
 from emailtemplates.helpers import TemplateSourceLoader
-from emailtemplates.models import EmailTemplate, MassEmailMessage, MassEmailAttachment
+from emailtemplates.models import (
+    EmailTemplate,
+    MassEmailMessage,
+    MassEmailAttachment,
+    MassEmailDelivery,
+    OutboxMessage,
+)
 from emailtemplates.registry import email_templates, NotRegistered
 
 
@@ -99,3 +113,309 @@ class MassEmailMessageTest(TestCase):
         self.assertTrue(attachments[0][0].endswith(".txt"))
         self.assertEqual(attachments[0][1], "Some content of example file.")
         self.assertEqual(attachments[0][2], "text/plain")
+
+    def test_send_renders_once_and_reuses_connection(self):
+        recipients = ["person@example.com", "another@example.com", "third@example.com"]
+        with mock.patch(
+            "emailtemplates.delivery.get_connection", wraps=mail.get_connection
+        ) as mock_get_connection, mock.patch.object(
+            ResolvedTemplate,
+            "render",
+            autospec=True,
+            side_effect=ResolvedTemplate.render,
+        ) as mock_render:
+            sent = self.mass_email_message.send(recipients)
+        self.assertTrue(sent)
+        self.assertEqual(mock_get_connection.call_count, 1)
+        self.assertEqual(mock_render.call_count, 1)
+        self.assertEqual([msg.to for msg in mail.outbox], [[r] for r in recipients])
+
+    def test_send_saves_progress_in_batches(self):
+        recipients = ["person%d@example.com" % i for i in range(5)]
+        with mock.patch.object(MassEmailMessage, "progress_batch_size", 2):
+            with mock.patch.object(
+                MassEmailMessage,
+                "save_progress",
+                autospec=True,
+                side_effect=MassEmailMessage.save_progress,
+            ) as mock_save_progress:
+                self.mass_email_message.send(recipients)
+        # initial state, after 2nd and 4th recipient and final state
+        self.assertEqual(mock_save_progress.call_count, 4)
+        self.mass_email_message.refresh_from_db()
+        self.assertEqual(self.mass_email_message.recipients_total, 5)
+        self.assertEqual(self.mass_email_message.recipients_sent, 5)
+        self.assertIsNotNone(self.mass_email_message.date_finished)
+
+    def test_send_to_default_recipients(self):
+        User = get_user_model()
+        for i in range(5):
+            User.objects.create(username="user%d" % i, email="user%d@example.com" % i)
+        with mock.patch.object(MassEmailMessage, "progress_batch_size", 2):
+            self.assertTrue(self.mass_email_message.send())
+        self.assertEqual(self.mass_email_message.recipients_total, 5)
+        self.assertEqual(
+            sorted(msg.to[0] for msg in mail.outbox),
+            ["user%d@example.com" % i for i in range(5)],
+        )
+
+    def test_default_recipients_fetched_in_chunks(self):
+        User = get_user_model()
+        for i in range(5):
+            User.objects.create(username="user%d" % i, email="user%d@example.com" % i)
+        with mock.patch.object(
+            MassEmailMessage, "recipients_chunk_size", 2
+        ), CaptureQueriesContext(connection) as queries:
+            self.assertTrue(self.mass_email_message.send())
+        user_queries = [
+            query["sql"]
+            for query in queries.captured_queries
+            if 'FROM "auth_user"' in query["sql"] and "COUNT" not in query["sql"]
+        ]
+        # chunks of 2, 2 and 1 recipients
+        self.assertEqual(len(user_queries), 3)
+        self.assertTrue(all("LIMIT 2" in sql for sql in user_queries))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_queued_mass_email_sent_by_mass_command(self):
+        self.mass_email_message.queue()
+        with mock.patch(
+            "emailtemplates.models.mass_mailing_recipients",
+            return_value=["person@example.com"],
+        ):
+            call_command("send_mass_emails", stdout=mock.Mock())
+        self.mass_email_message.refresh_from_db()
+        self.assertTrue(self.mass_email_message.sent)
+        self.assertEqual(mail.outbox[0].to, ["person@example.com"])
+
+    def test_queued_mass_email_not_sent_by_outbox_command(self):
+        self.mass_email_message.queue()
+        call_command("send_queued_emails", stdout=mock.Mock())
+        self.mass_email_message.refresh_from_db()
+        self.assertFalse(self.mass_email_message.sent)
+        self.assertIsNone(self.mass_email_message.date_started)
+        self.assertEqual(mail.outbox, [])
+
+    def interrupt(self, minutes_ago):
+        """
+        Simulates worker killed after sending to the first recipient.
+        """
+        self.mass_email_message.queue()
+        claimed = MassEmailMessage.objects.claim()
+        MassEmailDelivery.objects.create(
+            mass_email_message=claimed, email="person@example.com"
+        )
+        MassEmailMessage.objects.filter(pk=claimed.pk).update(
+            date_heartbeat=now() - timedelta(minutes=minutes_ago)
+        )
+        self.mass_email_message.refresh_from_db()
+
+    def test_running_mass_email_is_not_claimed_again(self):
+        self.interrupt(minutes_ago=1)
+        self.assertFalse(self.mass_email_message.stale)
+        self.assertIsNone(MassEmailMessage.objects.claim())
+
+    def test_stale_mass_email_is_claimed_again(self):
+        self.interrupt(minutes_ago=20)
+        self.assertTrue(self.mass_email_message.stale)
+        self.assertEqual(MassEmailMessage.objects.claim(), self.mass_email_message)
+        self.assertIsNone(MassEmailMessage.objects.claim())
+
+    def test_stale_mass_email_resumed_by_command(self):
+        self.interrupt(minutes_ago=20)
+        with mock.patch(
+            "emailtemplates.models.mass_mailing_recipients",
+            return_value=["person@example.com", "another@example.com"],
+        ):
+            call_command("send_mass_emails", stdout=mock.Mock())
+        self.mass_email_message.refresh_from_db()
+        self.assertTrue(self.mass_email_message.sent)
+        self.assertEqual(self.mass_email_message.recipients_sent, 2)
+        self.assertEqual([msg.to for msg in mail.outbox], [["another@example.com"]])
+
+    def test_send_saves_progress_on_heartbeat_interval(self):
+        recipients = ["person%d@example.com" % i for i in range(3)]
+        with mock.patch.object(MassEmailMessage, "heartbeat_interval", 0):
+            with mock.patch.object(
+                MassEmailMessage,
+                "save_progress",
+                autospec=True,
+                side_effect=MassEmailMessage.save_progress,
+            ) as mock_save_progress:
+                self.mass_email_message.send(recipients)
+        # initial state, after every recipient and final state
+        self.assertEqual(mock_save_progress.call_count, 5)
+
+    def test_running_worker_stops_when_message_reclaimed(self):
+        self.mass_email_message.queue()
+        worker_message = MassEmailMessage.objects.claim()
+        reclaimed = []
+
+        def recipients():
+            for i in range(6):
+                if i == 3:
+                    # worker looks dead to the others, e.g. it hung on a slow relay
+                    MassEmailMessage.objects.filter(pk=worker_message.pk).update(
+                        date_heartbeat=now() - timedelta(hours=1)
+                    )
+                    reclaimed.append(MassEmailMessage.objects.claim())
+                yield "person%d@example.com" % i
+
+        with mock.patch.object(MassEmailMessage, "progress_batch_size", 2):
+            sent = worker_message.send(recipients())
+        self.assertFalse(sent)
+        self.assertEqual(reclaimed, [self.mass_email_message])
+        self.assertEqual(len(mail.outbox), 4)
+        self.mass_email_message.refresh_from_db()
+        self.assertFalse(self.mass_email_message.sent)
+        self.assertIsNone(self.mass_email_message.date_finished)
+        self.assertEqual(
+            self.mass_email_message.date_started, reclaimed[0].date_started
+        )
+        self.assertEqual(self.mass_email_message.recipients_sent, 2)
+        self.assertEqual(
+            self.mass_email_message.deliveries.filter(delivered=True).count(), 4
+        )
+
+    def test_save_progress_updates_heartbeat(self):
+        self.mass_email_message.save_progress()
+        self.mass_email_message.refresh_from_db()
+        self.assertIsNotNone(self.mass_email_message.date_heartbeat)
+
+    def test_send_logs_deliveries(self):
+        recipients = ["person@example.com", "another@example.com"]
+        self.mass_email_message.send(recipients)
+        self.assertEqual(
+            sorted(
+                self.mass_email_message.deliveries.filter(delivered=True).values_list(
+                    "email", flat=True
+                )
+            ),
+            sorted(recipients),
+        )
+
+    def test_resume_skips_delivered_recipients(self):
+        MassEmailDelivery.objects.create(
+            mass_email_message=self.mass_email_message, email="person@example.com"
+        )
+        MassEmailDelivery.objects.create(
+            mass_email_message=self.mass_email_message,
+            email="another@example.com",
+            delivered=False,
+        )
+        recipients = ["person@example.com", "another@example.com", "third@example.com"]
+        with mock.patch.object(MassEmailMessage, "progress_batch_size", 2):
+            sent = self.mass_email_message.send(recipients)
+        self.assertTrue(sent)
+        self.assertEqual(
+            [msg.to for msg in mail.outbox],
+            [["another@example.com"], ["third@example.com"]],
+        )
+        self.assertEqual(self.mass_email_message.recipients_sent, 3)
+
+    def test_force_sends_to_all_recipients(self):
+        recipients = ["person@example.com", "another@example.com"]
+        self.mass_email_message.send(recipients)
+        self.mass_email_message.send(recipients, force=True)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_send_with_workers(self):
+        recipients = ["person%d@example.com" % i for i in range(10)]
+        sent = self.mass_email_message.send(recipients, workers=3)
+        self.assertTrue(sent)
+        self.assertEqual(sorted(msg.to[0] for msg in mail.outbox), sorted(recipients))
+
+    def test_send_to_generator(self):
+        recipients = ("person%d@example.com" % i for i in range(3))
+        sent = self.mass_email_message.send(recipients)
+        self.assertTrue(sent)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertIsNone(self.mass_email_message.recipients_total)
+        self.assertEqual(self.mass_email_message.recipients_sent, 3)
+
+    def test_send_to_queryset(self):
+        User = get_user_model()
+        User.objects.create(username="mike", email="mike@example.com")
+        User.objects.create(username="john", email="john@example.com")
+        recipients = User.objects.values_list("email", flat=True)
+        sent = self.mass_email_message.send(recipients)
+        self.assertTrue(sent)
+        self.assertEqual(self.mass_email_message.recipients_total, 2)
+        self.assertEqual(len(mail.outbox), 2)
+
+
+class OutboxMessageTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        EmailTemplate.objects.create(
+            title="outbox.html",
+            language="pl",
+            subject="Hi {{ user_name }}",
+            content="Hello {{ user_name }}",
+        )
+
+    def queue(self, to):
+        eft = EmailFromTemplate(
+            name="outbox.html", language="pl", registry_validation=False
+        )
+        eft.context = {"user_name": "John"}
+        return eft.send(to, attachments=[("file.bin", b"\x00\x01", None)], queue=True)
+
+    def test_queue(self):
+        self.assertEqual(self.queue(["john@example.com"]), 1)
+        self.assertEqual(mail.outbox, [])
+        outbox_message = OutboxMessage.objects.get()
+        self.assertEqual(outbox_message.status, OutboxMessage.STATUS_QUEUED)
+        self.assertEqual(outbox_message.template_name, "outbox.html")
+        self.assertEqual(outbox_message.to, ["john@example.com"])
+        msg = outbox_message.as_message()
+        self.assertEqual(msg.subject, "Hi John")
+        self.assertEqual(msg.body, "Hello John")
+        self.assertEqual(msg.content_subtype, "html")
+        self.assertEqual(msg.attachments[0][1], b"\x00\x01")
+
+    def test_send_queued_emails_command(self):
+        self.queue(["john@example.com"])
+        self.queue(["paul@example.com"])
+        call_command("send_queued_emails", stdout=mock.Mock())
+        self.assertEqual(
+            [msg.to for msg in mail.outbox],
+            [["john@example.com"], ["paul@example.com"]],
+        )
+        self.assertEqual(
+            OutboxMessage.objects.filter(status=OutboxMessage.STATUS_SENT).count(), 2
+        )
+        self.assertEqual(OutboxMessage.objects.send_queued(), (0, 0))
+
+    def test_claim(self):
+        self.queue(["john@example.com"])
+        self.queue(["paul@example.com"])
+        claimed = OutboxMessage.objects.claim(batch_size=1)
+        self.assertEqual(len(claimed), 1)
+        self.assertEqual(claimed[0].status, OutboxMessage.STATUS_SENDING)
+        self.assertEqual(claimed[0].attempts, 1)
+        self.assertEqual(len(OutboxMessage.objects.claim(batch_size=10)), 1)
+        self.assertEqual(OutboxMessage.objects.claim(batch_size=10), [])
+
+    def test_claim_stale_messages(self):
+        self.queue(["john@example.com"])
+        OutboxMessage.objects.claim()
+        OutboxMessage.objects.update(claimed=now() - timedelta(hours=1))
+        self.assertEqual(len(OutboxMessage.objects.claim()), 1)
+
+    @mock.patch("emailtemplates.delivery.logger", mock.Mock())
+    def test_failed_message_is_retried(self):
+        self.queue(["john@example.com"])
+        connection = mock.Mock()
+        connection.send_messages.side_effect = SMTPException("error")
+        self.assertEqual(
+            OutboxMessage.objects.send_queued(max_attempts=2, connection=connection),
+            (0, 1),
+        )
+        outbox_message = OutboxMessage.objects.get()
+        self.assertEqual(outbox_message.status, OutboxMessage.STATUS_QUEUED)
+        self.assertEqual(outbox_message.last_error, "error")
+        OutboxMessage.objects.update(claimed=now() - timedelta(hours=1))
+        OutboxMessage.objects.send_queued(max_attempts=2, connection=connection)
+        outbox_message.refresh_from_db()
+        self.assertEqual(outbox_message.status, OutboxMessage.STATUS_FAILED)
@@ -0,0 +1,71 @@
+# coding=utf-8
+import os
+import pstats
+import shutil
+import tempfile
+
+import mock
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from ..email import EmailFromTemplate
+from ..models import EmailTemplate
+
+
+class ProfilingTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        self.profile_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.profile_dir)
+        EmailTemplate.objects.create(
+            title="profiled/template.html",
+            language="pl",
+            subject="Hi",
+            content="Hello {{ user_name }}",
+        )
+
+    def send(self, **settings):
+        settings.setdefault("EMAILTEMPLATES_PROFILE_DIR", self.profile_dir)
+        settings.setdefault("EMAILTEMPLATES_PROFILE_SAMPLE_RATE", 1)
+        settings.setdefault("EMAILTEMPLATES_PROFILE_SLOW_THRESHOLD", 0)
+        with override_settings(**settings), mock.patch(
+            "emailtemplates.profiling.logger"
+        ):
+            eft = EmailFromTemplate(
+                name="profiled/template.html",
+                language="pl",
+                registry_validation=False,
+            )
+            eft.send(["to@example.com"])
+
+    def get_profiles(self):
+        return sorted(os.listdir(self.profile_dir))
+
+    def test_slow_send_profiled(self):
+        self.send()
+        (profile,) = self.get_profiles()
+        self.assertTrue(profile.endswith("-send-profiled_template.html-pl.prof"))
+        stats = pstats.Stats(os.path.join(self.profile_dir, profile))
+        self.assertTrue(
+            any(function == "render_message" for path, line, function in stats.stats)
+        )
+
+    def test_fast_send_not_saved(self):
+        self.send(EMAILTEMPLATES_PROFILE_SLOW_THRESHOLD=60)
+        self.assertEqual(self.get_profiles(), [])
+
+    def test_disabled(self):
+        with mock.patch("emailtemplates.profiling.cProfile.Profile") as mock_profile:
+            self.send(EMAILTEMPLATES_PROFILE_SAMPLE_RATE=0)
+        self.assertFalse(mock_profile.called)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_sampling(self):
+        with mock.patch("emailtemplates.profiling.random.random", return_value=0.5):
+            self.send(EMAILTEMPLATES_PROFILE_SAMPLE_RATE=0.1)
+        self.assertEqual(self.get_profiles(), [])
+
+    def test_ring_of_files(self):
+        for i in range(3):
+            self.send(EMAILTEMPLATES_PROFILE_MAX_FILES=2)
+        self.assertEqual(len(self.get_profiles()), 2)
@@ -0,0 +1,116 @@
+# coding=utf-8
+import shutil
+import tempfile
+
+import mock
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from ..forms import EmailTemplateAdminForm
+from ..registry import EmailTemplateRegistry
+from ..models import EmailTemplate, MassEmailAttachment, MassEmailMessage
+from ..testing import query_budget
+
+
+class QueryBudgetTest(TestCase):
+    def test_within_budget(self):
+        with query_budget(1) as queries:
+            EmailTemplate.objects.count()
+        self.assertEqual(len(queries), 1)
+
+    def test_budget_exceeded(self):
+        with self.assertRaisesMessage(
+            AssertionError, "2 queries executed, budget is 1"
+        ):
+            with query_budget(1):
+                EmailTemplate.objects.count()
+                EmailTemplate.objects.count()
+
+    def test_decorator(self):
+        @query_budget(0)
+        def count():
+            return EmailTemplate.objects.count()
+
+        with self.assertRaises(AssertionError):
+            count()
+
+
+class MassSendQueryBudgetTest(TestCase):
+    """
+    Maximum numbers of queries executed by mass email sending. Exceeding them usually means N+1 queries.
+    Budgets of EmailFromTemplate send paths are pinned in EmailFromTemplateQueriesTest.
+    """
+
+    def setUp(self):
+        mail.outbox = []
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+
+    def mass_send(self, recipient_count):
+        mass_email_message = MassEmailMessage.objects.create(
+            subject="Hi", content="Hello"
+        )
+        for i in range(3):
+            attachment = MassEmailAttachment(mass_email_message=mass_email_message)
+            attachment.attachment_file.save(
+                "mass-%d.txt" % i, ContentFile(b"content"), save=True
+            )
+        recipients = ["to%d@example.com" % i for i in range(recipient_count)]
+        batches = -(-recipient_count // mass_email_message.progress_batch_size)
+        # fixed cost and per batch of recipients: delivered lookup, deliveries insert, progress update
+        with query_budget(4 + 3 * batches):
+            mass_email_message.send(recipients)
+        self.assertEqual(len(mail.outbox), recipient_count)
+
+    def test_mass_send(self):
+        self.mass_send(1)
+
+    def test_mass_send_per_recipient(self):
+        self.mass_send(250)
+
+
+class AdminQueryBudgetTest(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+        self.client.force_login(self.user)
+        self.email_template = EmailTemplate.objects.create(
+            title="budget.html", language="pl", subject="Hi", content="Hello"
+        )
+        registry = EmailTemplateRegistry()
+        registry.register("budget.html", help_context={"user_name": "User name"})
+        for module in ("views", "forms"):
+            patcher = mock.patch("emailtemplates.%s.email_templates" % module, registry)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @override_settings(ROOT_URLCONF="emailtemplates.tests.urls")
+    def test_email_preview_view(self):
+        url = reverse("email_preview", kwargs={"pk": self.email_template.pk})
+        # session, user, email template
+        with query_budget(3):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(
+        TEMPLATES=[
+            {
+                "BACKEND": "django.template.backends.django.DjangoTemplates",
+                "APP_DIRS": True,
+            }
+        ]
+    )
+    def test_admin_form_init(self):
+        with query_budget(0):
+            EmailTemplateAdminForm()
+            EmailTemplateAdminForm(instance=self.email_template)
@@ -0,0 +1,61 @@
+# coding=utf-8
+from smtplib import SMTPException
+
+import mock
+from django.core import mail
+from django.test import TestCase
+
+from ..models import EmailTemplate, OutboxMessage
+from ..registry import email_templates
+from ..shortcuts import send_email, send_many
+
+
+@mock.patch.object(email_templates, "get_registration", mock.Mock())
+class ShortcutsTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        EmailTemplate.objects.create(
+            title="shortcut.html",
+            language="pl",
+            subject="Hi {{ user_name }}",
+            content="Hello {{ user_name }}",
+        )
+
+    def test_send_email_queue(self):
+        send_email(
+            "shortcut.html", {"user_name": "John"}, ["john@example.com"], queue=True
+        )
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboxMessage.objects.get().to, ["john@example.com"])
+
+    def test_send_many(self):
+        recipients = (
+            (email, {"user_name": name})
+            for email, name in (
+                ("john@example.com", "John"),
+                ("paul@example.com", "Paul"),
+            )
+        )
+        with self.assertNumQueries(2):
+            report = send_many("shortcut.html", recipients, language="pl")
+        self.assertEqual((report.sent, report.failed, len(report)), (2, 0, 2))
+        self.assertEqual(
+            [(msg.to, msg.subject, msg.body) for msg in mail.outbox],
+            [
+                (["john@example.com"], "Hi John", "Hello John"),
+                (["paul@example.com"], "Hi Paul", "Hello Paul"),
+            ],
+        )
+
+    @mock.patch("emailtemplates.delivery.logger", mock.Mock())
+    def test_send_many_failures(self):
+        connection = mock.Mock()
+        connection.send_messages.side_effect = [1, SMTPException("error")]
+        report = send_many(
+            "shortcut.html",
+            [("john@example.com", {}), ("paul@example.com", {})],
+            language="pl",
+            connection=connection,
+        )
+        self.assertEqual((report.sent, report.failed), (1, 1))
+        self.assertEqual(report.errors[0].to, ["paul@example.com"])
@@ -1,6 +1,8 @@
 # coding=utf-8
+import mock
 from django.test import TestCase
-from django.utils.translation import gettext as _
+from django.utils import translation
+from django.utils.translation import get_language, gettext as _
 
 from ..registry import EmailTemplateRegistry, RegistrationItem, HelpContext
 
@@ -160,3 +162,35 @@ class EmailTemplateRegistryTest(TestCase):
         items = list(template_registry.registration_items())
         self.assertEqual(1, len(items))
         self.assertEqual("hello_template.html", items[0].path)
+
+    def test_get_help_content_returns_copy(self):
+        template_registry = EmailTemplateRegistry()
+        template_registry.register(
+            "hello_template.html", help_context={"username": ("Name", "superman_90")}
+        )
+        help_content = template_registry.get_help_content("hello_template.html")
+        help_content["username"] = "changed"
+        self.assertEqual(
+            template_registry.get_help_content("hello_template.html"),
+            {"username": "superman_90"},
+        )
+
+    def test_form_help_text_memoized_per_language(self):
+        template_registry = EmailTemplateRegistry()
+        template_registry.register("hello_template.html", help_text="Hello template")
+        with mock.patch(
+            "emailtemplates.registry.render_to_string",
+            side_effect=lambda template_name, context: "%s %s"
+            % (get_language(), context["registration_item"].as_form_help_text()),
+        ) as mock_render_to_string:
+            for language in ("pl", "en", "pl", "en"):
+                with translation.override(language):
+                    form_help_text = template_registry.get_form_help_text(
+                        "hello_template.html"
+                    )
+                self.assertTrue(form_help_text.startswith(language))
+            self.assertEqual(mock_render_to_string.call_count, 2)
+            self.assertEqual(template_registry.get_form_help_text("unknown.html"), "")
+            template_registry.clear_cache()
+            template_registry.get_form_help_text("hello_template.html")
+            self.assertEqual(mock_render_to_string.call_count, 3)
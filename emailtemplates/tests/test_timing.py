@@ -0,0 +1,137 @@
+# coding=utf-8
+from io import StringIO
+
+import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from ..email import EmailFromTemplate
+from ..models import EmailTemplate
+from ..signals import stage_timed
+from ..timing import TimingAggregator, TimingRecord, timings
+
+
+class TimingSignalTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        self.records = []
+        stage_timed.connect(self.receiver)
+        EmailTemplate.objects.create(
+            title="timing.html",
+            language="pl",
+            subject="Hi",
+            content="Hello {{ user_name }}",
+        )
+
+    def tearDown(self):
+        stage_timed.disconnect(self.receiver)
+
+    def receiver(self, sender, record, **kwargs):
+        self.records.append(record)
+
+    def get_eft(self):
+        return EmailFromTemplate(
+            name="timing.html", language="pl", registry_validation=False
+        )
+
+    def test_send_stages(self):
+        eft = self.get_eft()
+        eft.context = {"user_name": "Lucas"}
+        eft.send(["to@example.com", "another@example.com"])
+        self.assertEqual(
+            [record.stage for record in self.records],
+            ["attachments", "resolve", "render", "send"],
+        )
+        for record in self.records:
+            self.assertEqual(record.template_name, "timing.html")
+            self.assertEqual(record.language, "pl")
+            self.assertEqual(record.template_source, "database")
+            self.assertGreaterEqual(record.duration, 0)
+        render, send = self.records[2:]
+        self.assertEqual(render.size, len("Hello Lucas"))
+        self.assertEqual(send.recipients, 2)
+
+    def test_send_batch_stages(self):
+        self.get_eft().send_batch(
+            [("to@example.com", {"user_name": "A"}), ("b@example.com", {})]
+        )
+        self.assertEqual(
+            [record.stage for record in self.records],
+            ["attachments", "resolve", "render", "send", "render", "send"],
+        )
+        self.assertEqual(
+            {record.template_name for record in self.records}, {"timing.html"}
+        )
+
+
+class TimingAggregatorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.aggregator = TimingAggregator()
+
+    def record(self, stage="render", duration=0.1, size=10, recipients=None):
+        return TimingRecord(
+            stage, "timing.html", "pl", "database", duration, size, recipients
+        )
+
+    def test_add(self):
+        self.aggregator.add(self.record(duration=0.1))
+        self.aggregator.add(self.record(duration=0.3))
+        self.aggregator.add(self.record(stage="send", size=None, recipients=2))
+        stats = {stats["stage"]: stats for stats in self.aggregator.snapshot()}
+        self.assertEqual(stats["render"]["count"], 2)
+        self.assertAlmostEqual(stats["render"]["total"], 0.4)
+        self.assertEqual(stats["render"]["max"], 0.3)
+        self.assertEqual(stats["render"]["bytes"], 20)
+        self.assertEqual(stats["send"]["recipients"], 2)
+
+    def test_flush_and_read(self):
+        other = TimingAggregator()
+        self.aggregator.add(self.record(duration=0.1))
+        other.add(self.record(duration=0.2))
+        other.add(self.record(duration=0.3))
+        self.aggregator.flush()
+        # other process
+        with mock.patch("emailtemplates.timing.os.getpid", return_value=0):
+            other.flush()
+        (stats,) = self.aggregator.read()
+        self.assertEqual(stats["count"], 3)
+        self.assertEqual(stats["max"], 0.3)
+        self.aggregator.clear()
+        self.assertEqual(self.aggregator.read(), [])
+        self.assertEqual(self.aggregator.snapshot(), [])
+
+    def test_flushed_when_receiving_signal(self):
+        with self.settings(EMAILTEMPLATES_TIMINGS_FLUSH_INTERVAL=0):
+            self.aggregator(sender=None, record=self.record())
+        self.assertEqual(len(self.aggregator.read()), 1)
+
+
+class EmailTimingsCommandTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        timings.reset()
+
+    def tearDown(self):
+        timings.clear()
+
+    def call_command(self, *args):
+        out = StringIO()
+        call_command("email_timings", *args, stdout=out)
+        return out.getvalue()
+
+    def test_command(self):
+        self.assertEqual(self.call_command(), "No timings collected.\n")
+        timings.add(
+            TimingRecord("render", "timing.html", "pl", "database", 0.002, 10, None)
+        )
+        timings.flush()
+        output = self.call_command()
+        self.assertIn("timing.html", output)
+        self.assertIn("2.00", output)
+        self.assertIn('"count": 1', self.call_command("--json"))
+        self.assertEqual(self.call_command("--reset"), "Timings removed.\n")
+        self.assertEqual(self.call_command(), "No timings collected.\n")
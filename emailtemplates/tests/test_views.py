@@ -0,0 +1,83 @@
+# coding=utf-8
+from datetime import timedelta
+
+import mock
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from emailtemplates.models import MassEmailMessage, now
+
+
+@override_settings(ROOT_URLCONF="emailtemplates.tests.urls")
+class MassEmailViewsTest(TestCase):
+    def setUp(self):
+        mail.outbox = []
+        self.user = get_user_model().objects.create_superuser(
+            "admin", "admin@example.com", "password"
+        )
+        self.client.force_login(self.user)
+        self.mass_email_message = MassEmailMessage.objects.create(
+            subject="Subject", content="<p>Content</p>"
+        )
+
+    def test_send_mass_email_queues_message(self):
+        response = self.client.get(
+            reverse("send_mass_email", kwargs={"pk": self.mass_email_message.pk})
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(mail.outbox, [])
+        self.mass_email_message.refresh_from_db()
+        self.assertTrue(self.mass_email_message.queued)
+        self.assertEqual(
+            list(MassEmailMessage.objects.queued()), [self.mass_email_message]
+        )
+
+    def test_send_mass_email_already_queued(self):
+        self.mass_email_message.queue()
+        MassEmailMessage.objects.claim()
+        self.client.get(
+            reverse("send_mass_email", kwargs={"pk": self.mass_email_message.pk})
+        )
+        self.mass_email_message.refresh_from_db()
+        self.assertIsNotNone(self.mass_email_message.date_started)
+
+    def test_send_mass_email_requeues_stale_message(self):
+        self.mass_email_message.queue()
+        MassEmailMessage.objects.claim()
+        MassEmailMessage.objects.filter(pk=self.mass_email_message.pk).update(
+            date_heartbeat=now() - timedelta(hours=1)
+        )
+        self.client.get(
+            reverse("send_mass_email", kwargs={"pk": self.mass_email_message.pk})
+        )
+        self.mass_email_message.refresh_from_db()
+        self.assertIsNone(self.mass_email_message.date_started)
+        self.assertEqual(
+            list(MassEmailMessage.objects.queued()), [self.mass_email_message]
+        )
+
+    def test_mass_email_status(self):
+        self.mass_email_message.queue()
+        url = reverse("mass_email_status", kwargs={"pk": self.mass_email_message.pk})
+        response = self.client.get(url)
+        self.assertEqual(response.json()["done"], False)
+        self.assertIsNone(response.json()["started"])
+
+        claimed = MassEmailMessage.objects.claim()
+        self.assertEqual(claimed, self.mass_email_message)
+        self.assertIsNone(MassEmailMessage.objects.claim())
+        claimed.send(["person@example.com", "another@example.com"])
+        status = self.client.get(url).json()
+        self.assertEqual(status["done"], True)
+        self.assertEqual(status["total"], 2)
+        self.assertEqual(status["sent"], 2)
+        self.assertEqual(status["failed"], 0)
+
+    def test_mass_email_status_requires_staff(self):
+        self.client.logout()
+        response = self.client.get(
+            reverse("mass_email_status", kwargs={"pk": self.mass_email_message.pk})
+        )
+        self.assertEqual(response.status_code, 302)
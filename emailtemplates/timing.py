@@ -0,0 +1,183 @@
+# coding=utf-8
+import os
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import caches
+
+from .signals import stage_timed
+
+TimingRecord = namedtuple(
+    "TimingRecord",
+    [
+        "stage",
+        "template_name",
+        "language",
+        "template_source",
+        "duration",
+        "size",
+        "recipients",
+    ],
+)
+
+
+class timed_stage(object):
+    """
+    Context manager measuring duration of a stage of sending email, `stage_timed` signal is sent on exit.
+
+    Attributes not known on enter (template_source, size in bytes, recipients) may be set inside the block:
+        with timed_stage("render", name, language) as timer:
+            message = render()
+            timer.size = len(message)
+    """
+
+    def __init__(
+        self,
+        stage,
+        template_name=None,
+        language=None,
+        template_source=None,
+        size=None,
+        recipients=None,
+    ):
+        self.stage = stage
+        self.template_name = template_name
+        self.language = language
+        self.template_source = template_source
+        self.size = size
+        self.recipients = recipients
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        duration = time.perf_counter() - self.start
+        if stage_timed.has_listeners():
+            stage_timed.send(
+                sender=self.__class__,
+                record=TimingRecord(
+                    self.stage,
+                    self.template_name,
+                    self.language,
+                    self.template_source,
+                    duration,
+                    self.size,
+                    self.recipients,
+                ),
+            )
+
+
+class TimingAggregator(object):
+    """
+    Thread-safe, in-memory statistics of TimingRecords grouped by stage, template name and language.
+
+    Connect it to `stage_timed` signal (done when EMAILTEMPLATES_TIMINGS setting is True).
+    Statistics are written to Django cache (EMAILTEMPLATES_TIMINGS_CACHE_ALIAS) every
+    EMAILTEMPLATES_TIMINGS_FLUSH_INTERVAL seconds, so `email_timings` command can read them
+    for all processes.
+    """
+
+    key_prefix = "emailtemplates:timings"
+
+    def __init__(self):
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._flushed = time.monotonic()
+
+    def __call__(self, sender, record, **kwargs):
+        self.add(record)
+        if time.monotonic() - self._flushed > self.flush_interval:
+            self.flush()
+
+    @property
+    def flush_interval(self):
+        return getattr(settings, "EMAILTEMPLATES_TIMINGS_FLUSH_INTERVAL", 10)
+
+    @property
+    def cache(self):
+        return caches[
+            getattr(settings, "EMAILTEMPLATES_TIMINGS_CACHE_ALIAS", "default")
+        ]
+
+    @property
+    def process_key(self):
+        return "%s:%s:%d" % (self.key_prefix, socket.gethostname(), os.getpid())
+
+    def add(self, record):
+        key = (record.stage, record.template_name, record.language)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {
+                    "stage": record.stage,
+                    "template_name": record.template_name,
+                    "language": record.language,
+                    "count": 0,
+                    "total": 0.0,
+                    "max": 0.0,
+                    "bytes": 0,
+                    "recipients": 0,
+                }
+            stats["count"] += 1
+            stats["total"] += record.duration
+            stats["max"] = max(stats["max"], record.duration)
+            stats["bytes"] += record.size or 0
+            stats["recipients"] += record.recipients or 0
+
+    def snapshot(self):
+        """
+        Returns list of statistics dicts of this process.
+        """
+        with self._lock:
+            return [dict(stats) for stats in self._stats.values()]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+    def flush(self):
+        """
+        Saves statistics of this process in the cache.
+        """
+        self._flushed = time.monotonic()
+        timeout = getattr(settings, "EMAILTEMPLATES_TIMINGS_TIMEOUT", 24 * 60 * 60)
+        self.cache.set(self.process_key, self.snapshot(), timeout=timeout)
+        index_key = "%s:processes" % self.key_prefix
+        process_keys = self.cache.get(index_key) or []
+        if self.process_key not in process_keys:
+            process_keys.append(self.process_key)
+        self.cache.set(index_key, process_keys, timeout=timeout)
+
+    def read(self):
+        """
+        Returns statistics of all processes saved in the cache, merged.
+        """
+        merged = {}
+        process_keys = self.cache.get("%s:processes" % self.key_prefix) or []
+        for process_stats in self.cache.get_many(process_keys).values():
+            for stats in process_stats:
+                key = (stats["stage"], stats["template_name"], stats["language"])
+                if key not in merged:
+                    merged[key] = dict(stats)
+                    continue
+                merged_stats = merged[key]
+                for field in ("count", "total", "bytes", "recipients"):
+                    merged_stats[field] += stats[field]
+                merged_stats["max"] = max(merged_stats["max"], stats["max"])
+        return list(merged.values())
+
+    def clear(self):
+        """
+        Removes statistics of all processes from the cache and resets this process statistics.
+        """
+        index_key = "%s:processes" % self.key_prefix
+        self.cache.delete_many((self.cache.get(index_key) or []) + [index_key])
+        self.reset()
+
+
+timings = TimingAggregator()
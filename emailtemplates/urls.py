@@ -9,11 +9,20 @@ if django_version < parse('4.0'):
 else:
     from django.urls import re_path as url
 
-from emailtemplates.views import email_preview_view, send_mass_email_view
+from emailtemplates.views import (
+    email_preview_view,
+    send_mass_email_view,
+    mass_email_status_view,
+)
 
 urlpatterns = [
     url(r"^email-preview/(?P<pk>\d+)/$", email_preview_view, name="email_preview"),
     url(
         r"^send-mass-email/(?P<pk>\d+)/$", send_mass_email_view, name="send_mass_email"
     ),
+    url(
+        r"^mass-email-status/(?P<pk>\d+)/$",
+        mass_email_status_view,
+        name="mass_email_status",
+    ),
 ]
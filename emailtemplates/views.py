@@ -4,7 +4,7 @@ from django.urls import reverse
 
 from django.contrib import messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.http import HttpResponse, HttpResponseRedirect
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404, redirect
 from django.template import Template, Context
 from django.views import View
@@ -15,8 +15,12 @@ from emailtemplates.registry import email_templates
 
 
 class EmailPreviewView(View):
+    email_template = None
+
     def get_email_template(self):
-        return get_object_or_404(EmailTemplate, pk=self.kwargs["pk"])
+        if self.email_template is None:
+            self.email_template = get_object_or_404(EmailTemplate, pk=self.kwargs["pk"])
+        return self.email_template
 
     def get_context_data(self):
         email_template = self.get_email_template()
@@ -57,14 +61,37 @@ class SendMassEmailView(View):
                 ),
             )
             return self.redirect_back()
-        sent = mass_email_message.send()
-        if sent:
-            messages.success(request, _("Mass email sent successfully"))
-        else:
+        if mass_email_message.stale:
+            mass_email_message.queue()
             messages.warning(
-                request, _("Error occurred when trying to send mass email message.")
+                request,
+                _(
+                    "Sending of mass email was interrupted. "
+                    "It has been queued again and will be resumed by send_mass_emails command."
+                ),
             )
+            return self.redirect_back()
+        if mass_email_message.queued:
+            messages.info(request, _("Mass email is already queued for sending."))
+            return self.redirect_back()
+        mass_email_message.queue()
+        messages.success(
+            request,
+            _(
+                "Mass email has been queued. "
+                "It will be sent in the background by send_mass_emails command."
+            ),
+        )
         return self.redirect_back()
 
 
 send_mass_email_view = SendMassEmailView.as_view()
+
+
+class MassEmailStatusView(View):
+    def get(self, request, *args, **kwargs):
+        mass_email_message = get_object_or_404(MassEmailMessage, pk=self.kwargs["pk"])
+        return JsonResponse(mass_email_message.progress())
+
+
+mass_email_status_view = staff_member_required(MassEmailStatusView.as_view())
@@ -16,8 +16,8 @@ if __name__ == "__main__":
         "emailtemplates",
     )
     settings.MIDDLEWARE = (
-        "django.contrib.auth.middleware.AuthenticationMiddleware",
         "django.contrib.sessions.middleware.SessionMiddleware",
+        "django.contrib.auth.middleware.AuthenticationMiddleware",
         "django.contrib.messages.middleware.MessageMiddleware",
     )
     settings.DATABASES = {
@@ -38,6 +38,14 @@ if __name__ == "__main__":
         }
     ]
     django.setup()
+    if "--benchmark" in sys.argv:
+        from emailtemplates.tests.benchmarks import main
+
+        sys.exit(main(sys.argv[sys.argv.index("--benchmark") + 1 :]))
+    if "--load-test" in sys.argv:
+        from emailtemplates.tests.loadtest import main
+
+        sys.exit(main(sys.argv[sys.argv.index("--load-test") + 1 :]))
     TestRunner = get_runner(settings)
     test_runner = TestRunner(verbosity=3)
     failures = test_runner.run_tests(["emailtemplates"])